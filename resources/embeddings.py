@@ -0,0 +1,147 @@
+"""Shared, memory mapped word vectors.
+
+Reading a text file of GloVe vectors takes long and every process holds its own copy of the floats. The vectors here
+are compiled once into a float16 matrix of unit length rows (wordvectors.npy) with a word per line in
+wordvectors.vocab. The matrix is memory mapped, so loading is instant and the pages are shared between processes.
+
+Compile the vectors with:
+
+    python -m resources.embeddings glove.6B.300d.txt
+"""
+import argparse
+import os
+import re
+
+import numpy as np
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wordvectors')
+WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+EMOTIONS = ('anger', 'disgust', 'fear', 'happiness', 'sadness', 'surprise')
+# Words whose vectors are averaged to the centroid of each emotion
+EMOTION_SEEDS = {
+    'anger': ['anger', 'angry', 'rage', 'fury', 'hate', 'wrath'],
+    'disgust': ['disgust', 'disgusting', 'revolting', 'gross', 'nausea', 'repulsive'],
+    'fear': ['fear', 'afraid', 'terror', 'scared', 'dread', 'horror'],
+    'happiness': ['happiness', 'happy', 'joy', 'delight', 'cheerful', 'glad'],
+    'sadness': ['sadness', 'sad', 'sorrow', 'grief', 'misery', 'tears'],
+    'surprise': ['surprise', 'surprised', 'astonishment', 'amazed', 'sudden', 'wonder'],
+}
+EMOTION_ALIASES = {
+    'angry': 'anger', 'disgusted': 'disgust', 'afraid': 'fear', 'scared': 'fear', 'happy': 'happiness',
+    'joy': 'happiness', 'sad': 'sadness', 'surprised': 'surprise',
+}
+
+
+def emotion_name(emotion):
+    """One of EMOTIONS for an emotion or a common alias of it, e.g. 'sad' -> 'sadness'."""
+    emotion = emotion.lower()
+    return EMOTION_ALIASES.get(emotion, emotion)
+
+
+class WordVectors:
+    """Unit length word vectors with the centroids of the six basic emotions."""
+
+    def __init__(self, vocab, matrix):
+        """
+        Args:
+            vocab (list) : Word of every row of the matrix.
+            matrix (numpy.ndarray) : (words, dimensions) matrix of unit length rows.
+        """
+        self.vocab = vocab
+        self.index = {word: i for i, word in enumerate(vocab)}
+        self.matrix = matrix
+        self._centroids = None
+
+    @classmethod
+    def load(cls, path=PATH):
+        """Map the matrix saved by compile() at path (without extension)."""
+        with open(path + '.vocab', encoding='utf-8') as f:
+            vocab = f.read().split('\n')
+        return cls(vocab, np.load(path + '.npy', mmap_mode='r'))
+
+    @staticmethod
+    def compile(source, path=PATH, max_words=None):
+        """
+        Compile a GloVe style text file, a word and its floats per line, to the float16 matrix and vocab at path.
+
+        Args:
+            max_words (int) : Keep only the first max_words words, the most frequent ones in GloVe files.
+        """
+        vocab = []
+        rows = []
+        with open(source, encoding='utf-8') as f:
+            for line in f:
+                word, *values = line.rstrip().split(' ')
+                if max_words is not None and len(vocab) >= max_words:
+                    break
+                if not values:
+                    continue
+                row = np.array(values, dtype=np.float32)
+                norm = np.linalg.norm(row)
+                vocab.append(word)
+                rows.append((row / norm if norm else row).astype(np.float16))
+        np.save(path + '.npy', np.stack(rows))
+        with open(path + '.vocab', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(vocab))
+
+    def vector(self, word):
+        """Vector of the word, None if it is not in the vocabulary."""
+        i = self.index.get(word.lower())
+        return None if i is None else self.matrix[i]
+
+    def embed(self, texts):
+        """
+        Mean vectors of the known words of the texts, normalised to unit length.
+
+        Returns:
+            numpy.ndarray : (texts, dimensions) float32 matrix, zero rows for texts without known words.
+        """
+        owners = []
+        rows = []
+        for i, text in enumerate(texts):
+            for word in WORD.findall(text.lower()):
+                row = self.index.get(word)
+                if row is not None:
+                    owners.append(i)
+                    rows.append(row)
+        vectors = np.zeros((len(texts), self.matrix.shape[1]), dtype=np.float32)
+        if rows:
+            np.add.at(vectors, np.array(owners), self.matrix[np.array(rows)].astype(np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=vectors, where=norms > 0)
+
+    @property
+    def centroids(self):
+        """(EMOTIONS, dimensions) matrix of the unit length emotion centroids, computed on first use."""
+        if self._centroids is None:
+            self._centroids = self.embed([' '.join(EMOTION_SEEDS[emotion]) for emotion in EMOTIONS])
+        return self._centroids
+
+    def emotion_similarities(self, texts):
+        """Cosine similarities of the texts to every emotion centroid, a (texts, EMOTIONS) matrix."""
+        return self.embed(texts) @ self.centroids.T
+
+    def similarity_to_emotion(self, texts, emotion):
+        """Cosine similarities of the texts to the centroid of the emotion, e.g. 'sadness' or 'sad'."""
+        return self.emotion_similarities(texts)[:, EMOTIONS.index(emotion_name(emotion))]
+
+
+_word_vectors = None
+
+
+def get_word_vectors():
+    """The word vectors of this process, None if they have not been compiled."""
+    global _word_vectors
+    if _word_vectors is None and os.path.isfile(PATH + '.npy'):
+        _word_vectors = WordVectors.load()
+    return _word_vectors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile GloVe style word vectors to a memory mapped matrix.')
+    parser.add_argument('source', help='Text file with a word and its vector per line.')
+    parser.add_argument('--output', default=PATH, help='Path of the matrix and vocab, without extension.')
+    parser.add_argument('--max-words', type=int, default=None, help='Number of words to keep.')
+    args = parser.parse_args()
+    WordVectors.compile(args.source, args.output, args.max_words)
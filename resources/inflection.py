@@ -0,0 +1,93 @@
+"""Shared, memoised noun and verb inflection.
+
+Inflecting a word runs through the rule sets of pattern.en or inflect, which is slow in generation loops that inflect
+the same handful of words over and over. The functions here check a table of irregular forms first, fall back to the
+libraries otherwise and cache every answer. Both libraries are imported lazily, so groups only need the one they use.
+"""
+from functools import lru_cache
+
+CACHE_SIZE = 4096
+
+# Irregular singular -> plural nouns, the plural -> singular table is derived from it.
+IRREGULAR_PLURALS = {
+    'child': 'children', 'person': 'people', 'man': 'men', 'woman': 'women', 'foot': 'feet', 'tooth': 'teeth',
+    'goose': 'geese', 'mouse': 'mice', 'louse': 'lice', 'ox': 'oxen',
+    'cactus': 'cacti', 'fungus': 'fungi', 'nucleus': 'nuclei', 'radius': 'radii', 'stimulus': 'stimuli',
+    'analysis': 'analyses', 'crisis': 'crises', 'thesis': 'theses', 'hypothesis': 'hypotheses',
+    'phenomenon': 'phenomena', 'criterion': 'criteria', 'datum': 'data', 'medium': 'media',
+    'knife': 'knives', 'wife': 'wives', 'life': 'lives', 'wolf': 'wolves', 'leaf': 'leaves', 'half': 'halves',
+    'thief': 'thieves', 'shelf': 'shelves', 'calf': 'calves', 'loaf': 'loaves', 'elf': 'elves',
+}
+IRREGULAR_SINGULARS = {plural: singular for singular, plural in IRREGULAR_PLURALS.items()}
+
+# Nouns with the same singular and plural form.
+UNCOUNTABLE = {
+    'sheep', 'fish', 'deer', 'moose', 'swine', 'bison', 'salmon', 'trout', 'aircraft', 'series', 'species',
+}
+
+# Common irregular third person singular -> plural verb forms, answered without the rule engine.
+IRREGULAR_VERBS = {'is': 'are', 'was': 'were', 'has': 'have', 'does': 'do', 'goes': 'go'}
+
+_inflect_engine = None
+
+
+def _engine():
+    """The inflect engine, constructed once per process."""
+    global _inflect_engine
+    if _inflect_engine is None:
+        import inflect
+        _inflect_engine = inflect.engine()
+    return _inflect_engine
+
+
+def _match_case(word, inflected):
+    """Carry the capitalisation of word over to its inflected form."""
+    if word.isupper():
+        return inflected.upper()
+    if word[:1].isupper():
+        return inflected[:1].upper() + inflected[1:]
+    return inflected
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def singularize(word):
+    """Singular form of a noun, e.g. 'Wolves' -> 'Wolf'."""
+    lower = word.lower()
+    if lower in UNCOUNTABLE or lower in IRREGULAR_PLURALS:
+        return word
+    if lower in IRREGULAR_SINGULARS:
+        return _match_case(word, IRREGULAR_SINGULARS[lower])
+    from pattern.en import singularize as _singularize
+    return _singularize(word)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def pluralize(word):
+    """Plural form of a noun, e.g. 'Wolf' -> 'Wolves'."""
+    lower = word.lower()
+    if lower in UNCOUNTABLE or lower in IRREGULAR_SINGULARS:
+        return word
+    if lower in IRREGULAR_PLURALS:
+        return _match_case(word, IRREGULAR_PLURALS[lower])
+    from pattern.en import pluralize as _pluralize
+    return _pluralize(word)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def is_plural(noun):
+    """Whether the noun is in plural form, as told by inflect's singular_noun."""
+    lower = noun.lower()
+    if lower in IRREGULAR_SINGULARS:
+        return True
+    if lower in IRREGULAR_PLURALS:
+        return False
+    return _engine().singular_noun(noun) is not False
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def plural_verb(verb):
+    """Plural form of a third person singular verb, e.g. 'walks' -> 'walk'."""
+    lower = verb.lower()
+    if lower in IRREGULAR_VERBS:
+        return _match_case(verb, IRREGULAR_VERBS[lower])
+    return _engine().plural_verb(verb)
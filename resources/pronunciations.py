@@ -0,0 +1,211 @@
+"""Shared, memory mapped CMU dictionary pronunciations.
+
+Parsing the CMU dictionary takes seconds and every process holds its own copy of it as nested lists of strings. The
+pronunciations here are compiled once into pronunciations.bin, with the words sorted so that a word is found with a
+binary search over the mapped file. Loading is instant and the pages are shared between processes.
+
+Compile the pronunciations with (done on first use otherwise):
+
+    python -m resources.pronunciations
+"""
+from array import array
+import mmap
+import os
+import struct
+
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pronunciations.bin')
+
+# Layout of the file: header, newline separated phoneme names, the sorted,
+# newline terminated words, then uint32 arrays (word offsets into the words,
+# first entry of every word, word of every entry, phoneme offsets of every
+# entry) and finally the uint8 phoneme ids of all entries.
+MAGIC = b'CMUP'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIII')
+
+
+def find_word(words, offsets, word):
+    """
+    Binary search for a word in a blob of sorted, newline terminated words.
+
+    Args:
+        words (bytes-like) : UTF-8 words sorted by their bytes, each followed by a newline.
+        offsets (sequence of int) : Start of every word in the blob, and its end as the last offset.
+        word (str) : Word to find.
+
+    Returns:
+        int : Index of the word, -1 if it is not in the blob.
+    """
+    key = word.encode('utf-8')
+    lo, hi = 0, len(offsets) - 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        # The newline is left out of the comparison.
+        candidate = bytes(words[offsets[mid]:offsets[mid + 1] - 1])
+        if candidate < key:
+            lo = mid + 1
+        elif candidate > key:
+            hi = mid
+        else:
+            return mid
+    return -1
+
+
+def cmudict_entries():
+    """(word, phonemes) pairs of the CMU dictionary, from the cmudict package or else nltk's corpus."""
+    try:
+        import cmudict
+    except ImportError:
+        import nltk
+        nltk.download('cmudict', quiet=True)
+        return nltk.corpus.cmudict.entries()
+    return cmudict.entries()
+
+
+class Pronunciations:
+    """
+    Every pronunciation (entry) of every word of the CMU dictionary, as phoneme ids.
+
+    The phonemes of all entries are kept in one flat array, entry e owns
+    phonemes[entry_offsets[e]:entry_offsets[e+1]], and the entries of word i
+    are word_entries[i]:word_entries[i+1], the first one being the most common.
+    """
+
+    def __init__(self, names, words, word_offsets, word_entries, entry_words, entry_offsets, phonemes, buffer=None):
+        self.names = names
+        self.name_ids = {name: i for i, name in enumerate(names)}
+        self.words = words
+        self.word_offsets = word_offsets
+        self.word_entries = word_entries
+        self.entry_words = entry_words
+        self.entry_offsets = entry_offsets
+        self.phonemes = phonemes
+        # Keeps the mapping alive while the arrays are views into it.
+        self._buffer = buffer
+
+    def __len__(self):
+        return len(self.word_offsets) - 1
+
+    @property
+    def n_entries(self):
+        return len(self.entry_offsets) - 1
+
+    @classmethod
+    def build(cls, entries=None):
+        """Build the store from (word, phonemes) pairs, the CMU dictionary if None."""
+        pronunciations = {}
+        for word, phonemes in cmudict_entries() if entries is None else entries:
+            pronunciations.setdefault(word, []).append(phonemes)
+
+        names = []
+        name_ids = {}
+        words = bytearray()
+        word_offsets = array('I', [0])
+        word_entries = array('I', [0])
+        entry_words = array('I')
+        entry_offsets = array('I', [0])
+        phonemes = array('B')
+        for word in sorted(pronunciations, key=lambda w: w.encode('utf-8')):
+            words += word.encode('utf-8') + b'\n'
+            word_offsets.append(len(words))
+            for entry in pronunciations[word]:
+                for phoneme in entry:
+                    if phoneme not in name_ids:
+                        name_ids[phoneme] = len(names)
+                        names.append(phoneme)
+                    phonemes.append(name_ids[phoneme])
+                entry_offsets.append(len(phonemes))
+                entry_words.append(len(word_offsets) - 2)
+            word_entries.append(len(entry_offsets) - 1)
+        return cls(names, bytes(words), word_offsets, word_entries, entry_words, entry_offsets, phonemes)
+
+    def save(self, path=PATH):
+        names = '\n'.join(self.names).encode('utf-8')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(names), len(self.words), len(self), self.n_entries))
+            f.write(names)
+            f.write(self.words)
+            for values in (self.word_offsets, self.word_entries, self.entry_words, self.entry_offsets):
+                f.write(b'\0' * (-f.tell() % 4))
+                f.write(array('I', values).tobytes())
+            f.write(bytes(self.phonemes))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=PATH):
+        """Map the store saved with save(). Raises ValueError if the file is of another format version."""
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, names_size, words_size, n_words, n_entries = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            buffer.close()
+            raise ValueError(f'{path} is not a version {VERSION} pronunciation store')
+
+        view = memoryview(buffer)
+        position = HEADER.size
+        names = bytes(view[position:position + names_size]).decode('utf-8').split('\n')
+        position += names_size
+        words = view[position:position + words_size]
+        position += words_size
+        arrays = []
+        for length in (n_words + 1, n_words + 1, n_entries, n_entries + 1):
+            position += -position % 4
+            arrays.append(view[position:position + 4 * length].cast('I'))
+            position += 4 * length
+        phonemes = view[position:position + arrays[-1][-1]]
+        return cls(names, words, *arrays, phonemes, buffer=buffer)
+
+    def word(self, i):
+        return bytes(self.words[self.word_offsets[i]:self.word_offsets[i + 1] - 1]).decode('utf-8')
+
+    def find(self, word):
+        """Index of the word, -1 if it is not in the dictionary."""
+        return find_word(self.words, self.word_offsets, word)
+
+    def entry(self, e):
+        """Phoneme ids of entry e."""
+        return self.phonemes[self.entry_offsets[e]:self.entry_offsets[e + 1]]
+
+    def lookup(self, word):
+        """Phoneme ids of the first pronunciation of the word, None if it is not in the dictionary."""
+        i = self.find(word)
+        if i < 0:
+            return None
+        return self.entry(self.word_entries[i])
+
+    def pronounce(self, word):
+        """Phoneme names of the first pronunciation of the word, None if it is not in the dictionary."""
+        phonemes = self.lookup(word)
+        if phonemes is None:
+            return None
+        return [self.names[p] for p in phonemes]
+
+    def pronunciations(self, word):
+        """All pronunciations of the word as tuples of phoneme names."""
+        i = self.find(word)
+        if i < 0:
+            return []
+        return [tuple(self.names[p] for p in self.entry(e))
+                for e in range(self.word_entries[i], self.word_entries[i + 1])]
+
+
+_pronunciations = None
+
+
+def get_pronunciations():
+    """The pronunciations of this process, compiled from the CMU dictionary and saved on first use."""
+    global _pronunciations
+    if _pronunciations is None:
+        try:
+            _pronunciations = Pronunciations.load()
+        except (FileNotFoundError, ValueError):
+            _pronunciations = Pronunciations.build()
+            _pronunciations.save()
+    return _pronunciations
+
+
+if __name__ == '__main__':
+    store = Pronunciations.build()
+    store.save()
+    print(f'{len(store)} words, {store.n_entries} pronunciations, {len(store.names)} phonemes')
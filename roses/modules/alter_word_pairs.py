@@ -1,8 +1,16 @@
 from typing import List, Tuple
 
 
+def iter_word_pairs(emotion: str, word_pairs: List[Tuple[str, str]]):
+    """
+    Lazily generates a bunch of word pairs depending on input word pairs and emotion.
+    """
+    for word_pair in word_pairs:
+        yield {'word_pair': (word_pair[0], word_pair[1]), 'verb': 'is'}
+
+
 def generate_word_pairs(emotion: str, word_pairs: List[Tuple[str, str]]):
     """
     Generates a bunch of word pairs depending on input word pairs and emotion.
     """
-    return [{'word_pair': (word_pair[0], word_pair[1]), 'verb': 'is'} for word_pair in word_pairs]
+    return list(iter_word_pairs(emotion, word_pairs))
@@ -1,10 +1,10 @@
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Tuple
 import string
-import nltk 
 import os
 import sys
 
-nltk.download('cmudict')
+from roses.modules.rhyme_index import get_rhyme_index # works with main.py
+# from modules.rhyme_index import get_rhyme_index # works with roses.py
 
 DEBUG = False
 REMOVE_SUBWORD_RHYMES = True
@@ -15,13 +15,13 @@ WORDS = ['crisscross', 'dos', 'chess', 'completed', 'depleted', 'hugged']
 LASTWORDLINE2 = "help"  
 
 def rhyme(inp, level):
-    entries = nltk.corpus.cmudict.entries()
-    syllables = [(word, syl) for word, syl in entries if word == inp]
+    index = get_rhyme_index()
+    syllables = index.pronunciations(inp)
     if DEBUG: print('syllables before matching rhymes', syllables)
     rhymes = []
-    for (word, syllable) in syllables:
-        rhyming_words = [word for word, pron in entries if pron[-level:] == syllable[-level:]]
-        rhyming_words = evaluate_rhymes(word, rhyming_words, REMOVE_SUBWORD_RHYMES)
+    for syllable in syllables:
+        rhyming_words = index.rhymes(syllable, level)
+        rhyming_words = evaluate_rhymes(inp, rhyming_words, REMOVE_SUBWORD_RHYMES)
         rhymes += rhyming_words
         if DEBUG: print(rhymes, " how many rhymes ", len(rhymes))
         
@@ -31,17 +31,10 @@ def evaluate_rhymes(word: str, rhymes: List[str], remove_subwords = False) -> Li
     """Remove bad rhymes. If remove_subwords is True, then we will remove rhymes like 'help' if the word is 'self-help'."""
 
     if not remove_subwords:
-        return list(set(rhymes) - set(word)) # remove only the word itself
+        return list(set(rhymes) - {word}) # remove only the word itself
 
     if DEBUG: print(len(rhymes) , " rhymes before pruning")
-    to_be_removed = []
-
-    for rhyme in rhymes:
-        if rhyme in word:
-            if DEBUG: print(rhyme + ' is going to be deleted for word ' + word)
-            to_be_removed.append(rhyme)
-
-    rhymes = list(set(rhymes) - set(to_be_removed))
+    rhymes = [rhyme for rhyme in set(rhymes) if rhyme not in word]
     if DEBUG: print(len(rhymes) , "after pruning")
     return rhymes
 
@@ -52,19 +45,23 @@ def define_strictness_of_rhyme(wordToRhyme):
             strictness = 2
     return strictness
 
-def generate_rhyming_words(emotion: str, word_pairs: List[Dict[str, Tuple[str, str]]]):
+def iter_rhyming_words(emotion: str, word_pairs: Iterable[Dict[str, Tuple[str, str]]]):
     """
-    Finds possible rhyming words for the ending of line 2
+    Lazily finds possible rhyming words for the ending of line 2
     """
 
-    partials_and_rhymes = []
     for row in word_pairs:
         last_word_line2 = row['word_pair'][1] # see an example input in the end of this file
         strictness = define_strictness_of_rhyme(last_word_line2)
         row['rhymes'] = rhyme(last_word_line2, strictness)
-        partials_and_rhymes.append(row)
+        yield row
+
+def generate_rhyming_words(emotion: str, word_pairs: List[Dict[str, Tuple[str, str]]]):
+    """
+    Finds possible rhyming words for the ending of line 2
+    """
 
-    return partials_and_rhymes
+    return list(iter_rhyming_words(emotion, word_pairs))
 
 # For testing
 if __name__ == '__main__':
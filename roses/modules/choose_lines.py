@@ -1,56 +1,50 @@
-from typing import Dict, List
-import json
+from typing import Dict, Iterable, List
 import random
-import os
-from roses.utils import read_json_file # works with main.py
-# from utils import read_json_file # works with roses.py
-import string
+from roses.modules.line_store import get_line_store # works with main.py
+from roses.modules.verse_store import get_verse_store # works with main.py
+# from modules.line_store import get_line_store # works with roses.py
+# from modules.verse_store import get_verse_store # works with roses.py
 
-def find_lines(emotion: str, rhyming_partials: List[Dict]):
+def get_store():
     """
-    Creates combinations of ending lines (3rd and 4th) from some knowledgebase.
+    Lines of all corpora if the line store has been built, else the bible
+    verses, read and indexed by last word once per process.
     """
+    return get_line_store() or get_verse_store()
 
-    data = read_json_file("data/bible_kjv_wrangled.json")
-    
-    # There probably is a better/faster way to do this using dictionaries but I dont know how rn
-    keys = []
-    sentences = []
-    last_word_of_sentences = []
-    
-    for key, value in data.items():
-        keys.append(key)
-        sentences.append(value)
-        last_word_of_sentence = value.translate(str.maketrans('', '', string.punctuation))
-        last_word_of_sentence = last_word_of_sentence.strip().split(' ')[-1]
-        last_word_of_sentences.append(last_word_of_sentence.lower())
-
-    
- 
-
-    ret = []
-    for partial in rhyming_partials:
-        for word in partial['rhymes']:
-            rhyming_sentences = []
-            indices = [i for i, x in enumerate(last_word_of_sentences) if x == word]
-            if indices:
-                for ix in indices:
-                    rhyming_sentences.append(keys[ix])
 
+def iter_lines(emotion: str, rhyming_partials: Iterable[Dict]):
+    """
+    Lazily creates combinations of ending lines (3rd and 4th) from some knowledgebase.
 
+    The ids of the lines in the store are kept in 'rest_ids', so that their
+    stress patterns can be read from the store when the poems are scored.
+    """
+    store = get_store()
 
-            third = data[random.choice(list(data))]
+    for partial in rhyming_partials:
+        for word in partial['rhymes']:
+            rhyming_sentences = store.ending_with(word)
 
-            # selects rhyming sentence if there is at least one, else select random sentence as before
+            third = random.randrange(len(store))
+
+            # selects rhyming sentence if there is at least one, else skip the rhyme
             if rhyming_sentences:
-                fourth = data[random.choice(rhyming_sentences)]
+                fourth = random.choice(rhyming_sentences)
             else:
                 continue
             
             new_partial = partial.copy()
-            new_partial['rest'] = (third, fourth)
-            ret.append(new_partial)
-    return ret
+            new_partial['rest'] = (store.line(third), store.line(fourth))
+            new_partial['rest_ids'] = (third, fourth)
+            yield new_partial
+
+
+def find_lines(emotion: str, rhyming_partials: List[Dict]):
+    """
+    Creates combinations of ending lines (3rd and 4th) from some knowledgebase.
+    """
+    return list(iter_lines(emotion, rhyming_partials))
 
 
 # For testing
@@ -1,14 +1,19 @@
-from typing import Dict, List
+from typing import Dict, Iterable, List
 
 
-def alter_rest(emotion: str, rhyming_partials: List[Dict]):
+def iter_alter_rest(emotion: str, rhyming_partials: Iterable[Dict]):
     """
-    Alters the third and fourth lines to be more creative.
+    Lazily alters the third and fourth lines to be more creative.
     """
-    ret = []
     for partial in rhyming_partials:
         third = partial['rest'][0]
         fourth = partial['rest'][1]
-        ret.append(partial)
+        # Lines altered here must drop 'rest_ids', which points to the unaltered lines in the store.
+        yield partial
 
-    return ret
+
+def alter_rest(emotion: str, rhyming_partials: List[Dict]):
+    """
+    Alters the third and fourth lines to be more creative.
+    """
+    return list(iter_alter_rest(emotion, rhyming_partials))
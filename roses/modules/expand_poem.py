@@ -1,21 +1,38 @@
-from typing import Dict, List
+from typing import Dict, Iterable, List
 
 from roses.modules.to_be_or_not_to_be import fit_verb # works with main.py
 # from modules.to_be_or_not_to_be import fit_verb # works with roses.py
 
 DEBUG = False
 
-def fill_and_create_text(emotion: str, rhyming_partials: List[Dict]):
+
+class Poem(list):
     """
-    Finishes the poem to be a 4 long list containing the poems lines.
+    Lines of a poem, with the store ids of the third and fourth line in rest_ids if they were taken from the store
+    as they are (see choose_lines.iter_lines), else None.
     """
-    if DEBUG: print(rhyming_partials[0]['rest'])
-    return [
-        [
+
+    def __init__(self, lines, rest_ids=None):
+        super().__init__(lines)
+        self.rest_ids = rest_ids
+
+
+def iter_poems(emotion: str, rhyming_partials: Iterable[Dict]):
+    """
+    Lazily finishes the poems to be 4 long lists containing the poems lines.
+    """
+    for rp in rhyming_partials:
+        yield Poem([
             'Roses are red',
             f'{rp["word_pair"][0]} {fit_verb(rp["word_pair"], rp["verb"])} {rp["word_pair"][1]}',
             rp['rest'][0],
             rp['rest'][1]
-        ]
-        for rp in rhyming_partials
-    ]
+        ], rp.get('rest_ids'))
+
+
+def fill_and_create_text(emotion: str, rhyming_partials: List[Dict]):
+    """
+    Finishes the poem to be a 4 long list containing the poems lines.
+    """
+    if DEBUG: print(rhyming_partials[0]['rest'])
+    return list(iter_poems(emotion, rhyming_partials))
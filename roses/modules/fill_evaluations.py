@@ -2,9 +2,19 @@ from typing import List, Tuple
 from random import randint
 import numpy as np
 
+from resources.embeddings import get_word_vectors
+from roses.modules.choose_lines import get_store # works with main.py
+from roses.modules.novelty import get_novelty_index # works with main.py
+from roses.modules.syllables import MASK_BITS, stress_columns # works with main.py
+# from modules.choose_lines import get_store # works with roses.py
+# from modules.novelty import get_novelty_index # works with roses.py
+# from modules.syllables import MASK_BITS, stress_columns # works with roses.py
+
 DEBUG = False
+OPTIMAL_LENGTH = 77 # scientifically proven
 
-#TODO evaluate novelty w.r.t. all the poems written previously (pushes the algo to search different parts of T)
+# Columns of the score matrix returned by score_poems
+CRITERIA = ('semantics', 'length', 'rhythm', 'emotion', 'dissimilarity', 'novelty')
 
 def eval_semantics(poem: List[str]):
   """Does it make sense?
@@ -19,7 +29,7 @@ def eval_length(poem: List[str]):
   
   exp(- Square root of the absolute distance to the optimal length).
   """
-  optimal_length = 77 # scientifically proven
+  optimal_length = OPTIMAL_LENGTH
 
   l = 0
   for line in poem:
@@ -29,19 +39,56 @@ def eval_length(poem: List[str]):
   if DEBUG: print(f'\teval length score {score}')
   return score
 
+def rhythm_scores(thirds: List[str], fourths: List[str]):
+  """Rhythm of many pairs of third and fourth lines at once, see column_rhythm_scores."""
+  return column_rhythm_scores(stress_columns(thirds), stress_columns(fourths))
+
+def column_rhythm_scores(thirds: Tuple[np.ndarray, np.ndarray], fourths: Tuple[np.ndarray, np.ndarray]):
+  """Rhythm of many pairs of third and fourth lines given as syllable counts and stress masks, see stress_columns.
+
+  Half of the score is exp(- a quarter of the difference in syllables), the other half the share of syllables that
+  are stressed alike in both lines, aligned at their ends where they rhyme.
+  """
+  syllables3, masks3 = thirds
+  syllables4, masks4 = fourths
+  balance = np.exp(-np.abs(syllables3 - syllables4) / 4)
+
+  compared = np.minimum(np.minimum(syllables3, syllables4), MASK_BITS)
+  low_bits = np.where(compared >= MASK_BITS, np.uint64(2**64 - 1),
+                      (np.uint64(1) << compared.astype(np.uint64)) - np.uint64(1))
+  alike = ~(masks3 ^ masks4) & low_bits
+  n_alike = np.unpackbits(alike.view(np.uint8)).reshape(-1, 64).sum(axis=1)
+  agreement = np.divide(n_alike, compared, out=np.zeros(len(compared)), where=compared > 0)
+  return (balance + agreement) / 2
+
 def eval_rhytm(poem: List[str]):
   """Does it have a nice rhythm, ie. a good amount of syllables in right places?
   
-  This could be done with nltk.
+  Compares the syllable counts and stress patterns of the third and fourth line, see rhythm_scores.
   """
-  return 1
+  score = rhythm_scores([poem[2]], [poem[3]])[0]
+  if DEBUG: print(f'\teval rhythm score {score}')
+  return score
+
+def emotion_scores(poems: List[List[str]], emotion: str):
+  """Feeling of many poems at once.
+
+  (1 + cosine similarity) / 2 of the mean word vector of each poem and the centroid of the emotion, 1 for all poems
+  if the word vectors in resources have not been compiled.
+  """
+  vectors = get_word_vectors()
+  if vectors is None:
+    return np.ones(len(poems))
+  return (1 + vectors.similarity_to_emotion([' '.join(poem) for poem in poems], emotion)) / 2
 
 def eval_similarity_to_emotion(poem: List[str], emotion: str):
   """Is the feeling of the poem similar to the emotion given as input?
   
-  This one could use Vord2Vec to calculate semantic distances.
+  Uses word vectors to calculate semantic distances, see emotion_scores.
   """
-  return 1
+  score = emotion_scores([poem], emotion)[0]
+  if DEBUG: print(f'\teval similarity to emotion score {score}')
+  return score
 
 def eval_dissimilarity_to_word_pairs(poem: List[str], word_pairs: List[Tuple[str, str]]):
   """Has the system been able to alter the word pair from the original input in a craetive manner?
@@ -56,21 +103,70 @@ def eval_dissimilarity_to_word_pairs(poem: List[str], word_pairs: List[Tuple[str
   if DEBUG: print(f'\tscore for dissimilarity to word pairs {score}')
   return score
 
+def score_poems(emotion: str, word_pairs: List[Tuple[str, str]], poems: List[List[str]]):
+  """
+  Scores all given poems at once.
+
+  The poems are turned into a (poems, lines) array of strings, and every criterion is computed over its columns
+  with vectorized operations instead of per poem function calls.
+
+  Returns a (poems, criteria) matrix, the columns are in the order of CRITERIA.
+  """
+  scores = np.ones((len(poems), len(CRITERIA)))
+  if not poems:
+    return scores
+  lines = np.array(poems, dtype=np.str_)
+
+  # length: exp(- square root of the absolute distance to the optimal length)
+  lengths = np.char.str_len(lines).sum(axis=1)
+  scores[:, CRITERIA.index('length')] = np.exp(-np.sqrt(np.abs(lengths - OPTIMAL_LENGTH)))
+
+  # dissimilarity: exp(- sum of the positions of the word pair words in the second line)
+  positions = np.zeros(len(poems))
+  for pair in word_pairs:
+    positions += np.char.find(lines[:, 1], pair[0])
+    positions += np.char.find(lines[:, 1], pair[1])
+  scores[:, CRITERIA.index('dissimilarity')] = np.exp(-positions)
+
+  # rhythm: syllables and stress masks of lines taken from the store are gathered from its columns by id (see
+  # expand_poem.Poem), only the other lines are analysed
+  rest_ids = [getattr(poem, 'rest_ids', None) for poem in poems]
+  stored = np.array([ids is not None for ids in rest_ids])
+  syllables = np.zeros((len(poems), 2), dtype=np.int64)
+  masks = np.zeros((len(poems), 2), dtype=np.uint64)
+  if stored.any():
+    stored_syllables, stored_masks = get_store().stress_columns([i for ids in rest_ids if ids is not None for i in ids])
+    syllables[stored] = stored_syllables.reshape(-1, 2)
+    masks[stored] = stored_masks.reshape(-1, 2)
+  if not stored.all():
+    for column in (0, 1):
+      syllables[~stored, column], masks[~stored, column] = stress_columns(lines[~stored, column + 2].tolist())
+  scores[:, CRITERIA.index('rhythm')] = column_rhythm_scores((syllables[:, 0], masks[:, 0]),
+                                                             (syllables[:, 1], masks[:, 1]))
+
+  scores[:, CRITERIA.index('emotion')] = emotion_scores(poems, emotion)
+
+  scores[:, CRITERIA.index('novelty')] = 1 - get_novelty_index().max_similarity(poems)
+
+  if DEBUG: print(f'\tscore matrix {CRITERIA}\n{scores}')
+  return scores
+
+def eval_novelty(poem: List[str]):
+  """Is it different from all the poems written previously? Pushes the algo to search different parts of T.
+
+  1 - the estimated highest similarity to a poem in the novelty index.
+  """
+  score = 1 - get_novelty_index().max_similarity([poem])[0]
+  if DEBUG: print(f'\teval novelty score {score}')
+  return score
+
 def evaluate_poems(emotion: str, word_pairs: List[Tuple[str, str]], poems: List[List[str]]):
   """
-  Evaluates given poems and gives them a score.
+  Evaluates given poems and gives them a score, the sum of their criteria in score_poems.
   """
 
-  scores = [0]*len(poems)
-  for i, poem in enumerate(poems):
-    if DEBUG: print(f'for poem {poem}')
-    scores[i] += eval_semantics(poem)
-    scores[i] += eval_length(poem)
-    scores[i] += eval_rhytm(poem)
-    scores[i] += eval_similarity_to_emotion(poem, emotion)
-    scores[i] += eval_dissimilarity_to_word_pairs(poem, word_pairs)
-  
-  return list(zip(poems, scores))
+  scores = score_poems(emotion, word_pairs, poems).sum(axis=1)
+  return list(zip(poems, scores.tolist()))
 
 
 # For testing
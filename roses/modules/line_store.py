@@ -0,0 +1,297 @@
+from array import array
+from typing import Container, Iterable, Iterator, List, Sequence, Tuple, Union
+import argparse
+import glob
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from resources.pronunciations import find_word
+from roses.modules.rhyme_index import LEVELS, get_rhyme_index # works with main.py
+from roses.modules.syllables import line_stress, stress_mask # works with main.py
+from roses.modules.verse_store import last_word # works with main.py
+# from modules.rhyme_index import LEVELS, get_rhyme_index # works with roses.py
+# from modules.syllables import line_stress, stress_mask # works with roses.py
+# from modules.verse_store import last_word # works with roses.py
+
+LINES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'lines')
+SHARD_SIZE = 1000000
+
+# Layout of a shard file: header, the UTF-8 text of all lines and the
+# newline separated, sorted last words, then uint64 line offsets into the
+# text and stress masks of the lines (see syllables.stress_mask), uint32
+# word offsets into the words, uint32 last-word ids and uint32 first line
+# (in order) of every word, uint32 line ids ordered by last word and finally
+# the uint8 syllable counts of the lines (at most 255).
+MAGIC = b'RSLS'
+VERSION = 3
+HEADER = struct.Struct('<4sIIIQQ')
+
+
+class LineShard:
+    """
+    One memory mapped file of lines with their last-word, syllable and stress mask columns.
+
+    Line i is text[line_offsets[i]:line_offsets[i+1]]. The last words are
+    sorted, and the lines ending in word w are
+    order[word_lines[w]:word_lines[w+1]].
+    """
+
+    def __init__(self, text, words, line_offsets, masks, word_offsets, last_words, word_lines, order, syllables,
+                 buffer=None):
+        self.text = text
+        self.words = words
+        self.line_offsets = line_offsets
+        self.masks = masks
+        self.word_offsets = word_offsets
+        self.last_words = last_words
+        self.word_lines = word_lines
+        self.order = order
+        self.syllables = syllables
+        self._buffer = buffer
+
+    def __len__(self):
+        return len(self.last_words)
+
+    @classmethod
+    def build(cls, lines: Sequence[str]) -> 'LineShard':
+        text = bytearray()
+        line_offsets = array('Q', [0])
+        masks = array('Q')
+        ends = []
+        syllables = array('B')
+        for line in lines:
+            text += line.encode('utf-8')
+            line_offsets.append(len(text))
+            pattern = line_stress(line)
+            masks.append(stress_mask(pattern))
+            ends.append(last_word(line))
+            syllables.append(min(255, len(pattern)))
+
+        vocab = sorted(set(ends), key=lambda w: w.encode('utf-8'))
+        word_ids = {word: i for i, word in enumerate(vocab)}
+        words = '\n'.join(vocab).encode('utf-8')
+        word_offsets = array('I', [0])
+        for word in vocab:
+            word_offsets.append(word_offsets[-1] + len(word.encode('utf-8')) + 1)
+        last_words = array('I', (word_ids[word] for word in ends))
+        order = array('I', sorted(range(len(last_words)), key=last_words.__getitem__))
+        word_lines = array('I', [0] * (len(vocab) + 1))
+        for w in last_words:
+            word_lines[w + 1] += 1
+        for w in range(len(vocab)):
+            word_lines[w + 1] += word_lines[w]
+        return cls(bytes(text), words, line_offsets, masks, word_offsets, last_words, word_lines, order, syllables)
+
+    def save(self, path: str):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(self.last_words), len(self.word_offsets) - 1,
+                                len(self.text), len(self.words)))
+            f.write(self.text)
+            f.write(self.words)
+            f.write(b'\0' * (-f.tell() % 8))
+            for values in (self.line_offsets, self.masks):
+                f.write(array('Q', values).tobytes())
+            for values in (self.word_offsets, self.last_words, self.word_lines, self.order):
+                f.write(array('I', values).tobytes())
+            f.write(bytes(self.syllables))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'LineShard':
+        """Map a shard saved with save(). Raises ValueError if the file is of another format version."""
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_lines, n_words, text_size, words_size = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            buffer.close()
+            raise ValueError(f'{path} is not a version {VERSION} line shard')
+
+        view = memoryview(buffer)
+        position = HEADER.size
+        text = view[position:position + text_size]
+        position += text_size
+        words = view[position:position + words_size]
+        position += words_size + (-(position + words_size) % 8)
+        line_offsets = view[position:position + 8 * (n_lines + 1)].cast('Q')
+        position += 8 * (n_lines + 1)
+        masks = view[position:position + 8 * n_lines].cast('Q')
+        position += 8 * n_lines
+        arrays = []
+        for length in (n_words + 1, n_lines, n_words + 1, n_lines):
+            arrays.append(view[position:position + 4 * length].cast('I'))
+            position += 4 * length
+        word_offsets, last_words, word_lines, order = arrays
+        syllables = view[position:position + n_lines]
+        return cls(text, words, line_offsets, masks, word_offsets, last_words, word_lines, order, syllables,
+                   buffer=buffer)
+
+    def line(self, i: int) -> str:
+        return bytes(self.text[self.line_offsets[i]:self.line_offsets[i + 1]]).decode('utf-8')
+
+    def word(self, i: int) -> str:
+        return bytes(self.words[self.word_offsets[i]:self.word_offsets[i + 1] - 1]).decode('utf-8')
+
+    def ending_with(self, word: str) -> Sequence[int]:
+        """Ids of the lines whose last word is word."""
+        w = find_word(self.words, self.word_offsets, word)
+        if w < 0:
+            return ()
+        return self.order[self.word_lines[w]:self.word_lines[w + 1]]
+
+
+class LineStore:
+    """
+    Lines of many corpora in memory mapped shards, queried by last word and rhyme class.
+
+    Only the pages that are read are loaded, so the store can hold millions
+    of lines without adding to the memory or startup time of a process.
+    Line ids are global, shard i holds ids bases[i]:bases[i+1].
+    """
+
+    def __init__(self, shards: List[LineShard]):
+        self.shards = shards
+        self.bases = [0]
+        for shard in shards:
+            self.bases.append(self.bases[-1] + len(shard))
+
+    @classmethod
+    def load(cls, directory: str = LINES_PATH) -> 'LineStore':
+        return cls([LineShard.load(path) for path in sorted(glob.glob(os.path.join(directory, 'shard-*.bin')))])
+
+    def __len__(self):
+        return self.bases[-1]
+
+    def _locate(self, i: int):
+        lo, hi = 0, len(self.shards) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.bases[mid] <= i:
+                lo = mid
+            else:
+                hi = mid - 1
+        return self.shards[lo], i - self.bases[lo]
+
+    def line(self, i: int) -> str:
+        shard, j = self._locate(i)
+        return shard.line(j)
+
+    def stress_columns(self, ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Syllable counts and stress masks of the lines as arrays, gathered from the shard columns."""
+        ids = np.asarray(ids, dtype=np.int64)
+        syllables = np.zeros(len(ids), dtype=np.int64)
+        masks = np.zeros(len(ids), dtype=np.uint64)
+        shards = np.searchsorted(self.bases, ids, side='right') - 1
+        for s in np.unique(shards):
+            selected = shards == s
+            local = ids[selected] - self.bases[s]
+            syllables[selected] = np.asarray(self.shards[s].syllables)[local]
+            masks[selected] = np.asarray(self.shards[s].masks)[local]
+        return syllables, masks
+
+    def ending_with(self, word: str) -> List[int]:
+        """Ids of the lines whose last word is word."""
+        word = word.lower()
+        return [base + j for shard, base in zip(self.shards, self.bases) for j in shard.ending_with(word)]
+
+    def lines_ending_in(self, rhyme_class: Sequence[str], syllables: Union[int, Container[int], None] = None
+                        ) -> List[int]:
+        """
+        Ids of the lines whose last word ends in the rhyme class.
+
+        Args:
+            rhyme_class: Last phonemes of a pronunciation, e.g. ('AH0', 'D'), see VerseStore.rhyme_class. Only the
+                last max(LEVELS) phonemes of longer classes are compared, no lines end in an empty class.
+            syllables: Syllable count, or counts (e.g. a range), the lines should have. Any count if None.
+        """
+        if not rhyme_class:
+            return []
+        if isinstance(syllables, int):
+            syllables = (syllables,)
+        level = min(len(rhyme_class), max(LEVELS))
+        words = get_rhyme_index().rhymes(rhyme_class, level)
+        ids = []
+        for shard, base in zip(self.shards, self.bases):
+            for word in words:
+                for j in shard.ending_with(word):
+                    if syllables is None or shard.syllables[j] in syllables:
+                        ids.append(base + j)
+        return ids
+
+
+_STORE = None
+
+
+def get_line_store() -> LineStore:
+    """The line store of this process, None if no shards have been built."""
+    global _STORE
+    if _STORE is None:
+        store = LineStore.load()
+        if not len(store):
+            return None
+        _STORE = store
+    return _STORE
+
+
+def read_corpus(path: str) -> Iterator[str]:
+    """
+    Stream the lines of a corpus.
+
+    Plain text files have a line per line, JSON lines files a string or an
+    object with a 'text' key per line and JSON files hold a list of lines
+    or an object whose values are lines, like data/bible_kjv_wrangled.json.
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            items = (json.loads(row) for row in f if row.strip())
+            for item in items:
+                yield item if isinstance(item, str) else item['text']
+        elif path.endswith('.json'):
+            data = json.load(f)
+            yield from data.values() if isinstance(data, dict) else data
+        else:
+            yield from f
+
+
+def build(corpora: Iterable[str], directory: str = LINES_PATH, shard_size: int = SHARD_SIZE) -> int:
+    """Write the lines of the corpora as shards of at most shard_size lines. Returns the number of lines."""
+    os.makedirs(directory, exist_ok=True)
+    for path in glob.glob(os.path.join(directory, 'shard-*.bin')):
+        os.remove(path)
+
+    n_lines = 0
+    n_shards = 0
+    lines = []
+
+    def flush():
+        nonlocal n_shards
+        LineShard.build(lines).save(os.path.join(directory, f'shard-{n_shards:05d}.bin'))
+        n_shards += 1
+        lines.clear()
+
+    for corpus in corpora:
+        for line in read_corpus(corpus):
+            line = ' '.join(line.split())
+            if not last_word(line):
+                continue
+            lines.append(line)
+            n_lines += 1
+            if len(lines) == shard_size:
+                flush()
+    if lines:
+        flush()
+    return n_lines
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the line store from plain text, JSON or JSON lines corpora.')
+    parser.add_argument('corpora', nargs='+', help='Corpus files.')
+    parser.add_argument('--output', default=LINES_PATH, help='Directory of the shards.')
+    parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='Lines per shard.')
+    args = parser.parse_args()
+    n = build(args.corpora, args.output, args.shard_size)
+    print(f'{n} lines in {len(glob.glob(os.path.join(args.output, "shard-*.bin")))} shards')
@@ -0,0 +1,157 @@
+from typing import List, Sequence, Union
+import os
+import zlib
+
+import numpy as np
+
+NOVELTY_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'novelty.npz')
+VERSION = 1
+SHINGLE = 5
+NUM_PERM = 64
+BANDS = 16
+MEMORY_BUDGET = 8 * 2**20
+# Rough bytes per poem: its signature and an id in a set of every band
+BAND_ENTRY_BYTES = 80
+
+Poem = Union[str, Sequence[str]]
+
+
+def shingles(poem: Poem) -> np.ndarray:
+    """crc32 hashes of the character shingles of a poem, lower cased with collapsed white space."""
+    text = poem if isinstance(poem, str) else '\n'.join(poem)
+    text = ' '.join(text.lower().split()).encode('utf-8')
+    if len(text) <= SHINGLE:
+        return np.array([zlib.crc32(text)], dtype=np.uint64)
+    return np.fromiter((zlib.crc32(text[i:i + SHINGLE]) for i in range(len(text) - SHINGLE + 1)),
+                       dtype=np.uint64, count=len(text) - SHINGLE + 1)
+
+
+class NoveltyIndex:
+    """
+    MinHash signatures of the poems written so far, in an LSH index for approximate max-similarity queries.
+
+    The signature of a poem is the minimum of NUM_PERM multiply-shift hashes
+    over its shingles, and the share of equal signature values estimates the
+    Jaccard similarity of two poems. Signatures are split into bands, and
+    only poems sharing a band with a query are compared to it. The index
+    holds at most max_entries poems in a ring buffer, the oldest are evicted.
+    """
+
+    def __init__(self, max_entries: int = None, num_perm: int = NUM_PERM, bands: int = BANDS,
+                 memory_budget: int = MEMORY_BUDGET, seed: int = 1):
+        """
+        Args:
+            max_entries: Most poems kept. Derived from memory_budget (bytes) if None.
+        """
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        if max_entries is None:
+            max_entries = max(1, memory_budget // (num_perm * 4 + bands * BAND_ENTRY_BYTES))
+        self.num_perm = num_perm
+        self.bands = bands
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(0, 2**63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.b = rng.randint(0, 2**63, size=num_perm, dtype=np.uint64)
+        self.signatures = np.zeros((max_entries, num_perm), dtype=np.uint32)
+        self.ids = np.full(max_entries, -1, dtype=np.int64)
+        self.next_id = 0
+        self.buckets = [{} for _ in range(bands)]
+
+    def __len__(self):
+        return int((self.ids >= 0).sum())
+
+    @property
+    def max_entries(self):
+        return len(self.ids)
+
+    def signature(self, poem: Poem) -> np.ndarray:
+        hashes = shingles(poem)[:, None] * self.a[None, :] + self.b[None, :]
+        return (hashes >> np.uint64(32)).min(axis=0).astype(np.uint32)
+
+    def _keys(self, signature: np.ndarray) -> List[bytes]:
+        return [band.tobytes() for band in np.split(signature, self.bands)]
+
+    def _index(self, slot: int):
+        for bucket, key in zip(self.buckets, self._keys(self.signatures[slot])):
+            bucket.setdefault(key, set()).add(slot)
+
+    def _unindex(self, slot: int):
+        for bucket, key in zip(self.buckets, self._keys(self.signatures[slot])):
+            slots = bucket.get(key)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del bucket[key]
+
+    def add(self, poems: Sequence[Poem]):
+        """Remember the poems, evicting the oldest ones when the index is full."""
+        for poem in poems:
+            slot = self.next_id % self.max_entries
+            if self.ids[slot] >= 0:
+                self._unindex(slot)
+            self.signatures[slot] = self.signature(poem)
+            self.ids[slot] = self.next_id
+            self._index(slot)
+            self.next_id += 1
+
+    def max_similarity(self, poems: Sequence[Poem]) -> np.ndarray:
+        """Estimated highest Jaccard similarity of each poem to any remembered poem, 0 if none shares a band."""
+        similarities = np.zeros(len(poems))
+        for i, poem in enumerate(poems):
+            signature = self.signature(poem)
+            slots = set()
+            for bucket, key in zip(self.buckets, self._keys(signature)):
+                slots.update(bucket.get(key, ()))
+            if slots:
+                similarities[i] = (self.signatures[list(slots)] == signature).mean(axis=1).max()
+        return similarities
+
+    def save(self, path: str = NOVELTY_PATH):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, version=VERSION, seed=self.seed, bands=self.bands, next_id=self.next_id,
+                 signatures=self.signatures, ids=self.ids)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = NOVELTY_PATH, **kwargs) -> 'NoveltyIndex':
+        """
+        Load the index saved at path, or an empty one with kwargs if there is none or it has other hashes.
+
+        A saved index of another size is resized to max_entries (or
+        memory_budget) from kwargs, keeping the newest poems.
+        """
+        index = cls(**kwargs)
+        try:
+            data = np.load(path)
+        except FileNotFoundError:
+            return index
+        with data:
+            if (data['version'] != VERSION or data['seed'] != index.seed or data['bands'] != index.bands
+                    or data['signatures'].shape[1] != index.num_perm):
+                return index
+
+            ids = data['ids']
+            signatures = data['signatures']
+            next_id = int(data['next_id'])
+        order = np.argsort(ids)[-index.max_entries:]
+        order = order[ids[order] >= 0]
+        base = next_id - len(order)
+        for i, old_slot in enumerate(order):
+            slot = (base + i) % index.max_entries
+            index.signatures[slot] = signatures[old_slot]
+            index.ids[slot] = base + i
+            index._index(slot)
+        index.next_id = next_id
+        return index
+
+
+_INDEX = None
+
+
+def get_novelty_index() -> NoveltyIndex:
+    """The novelty index of this process, loaded from disk on first use."""
+    global _INDEX
+    if _INDEX is None:
+        _INDEX = NoveltyIndex.load()
+    return _INDEX
@@ -0,0 +1,123 @@
+from array import array
+from typing import List, Sequence, Tuple
+import mmap
+import os
+import struct
+
+from resources.pronunciations import Pronunciations, get_pronunciations
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'rhymes.bin')
+LEVELS = (1, 2, 3, 4)
+
+# Layout of the index file: header and one uint32 entry order per level.
+# The entries are those of the shared pronunciation store it was built from.
+MAGIC = b'RSRI'
+VERSION = 2
+HEADER = struct.Struct('<4sIII')
+
+
+class RhymeIndex:
+    """
+    CMU dictionary pronunciations indexed by their phoneme suffixes.
+
+    The pronunciations (entries) are those of resources.pronunciations. For
+    every rhyme level there is an ordering of all entries by their last
+    `level` phonemes, so the words ending in a given suffix are one
+    contiguous, binary searched range.
+    """
+
+    def __init__(self, store: Pronunciations, orders, buffer=None):
+        self.store = store
+        self.orders = orders
+        self._buffer = buffer
+
+    @classmethod
+    def build(cls, store: Pronunciations) -> 'RhymeIndex':
+        orders = []
+        for level in LEVELS:
+            keys = [bytes(store.entry(e)[-level:]) for e in range(store.n_entries)]
+            orders.append(array('I', sorted(range(store.n_entries), key=keys.__getitem__)))
+        return cls(store, orders)
+
+    def save(self, path: str = INDEX_PATH):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.store.n_entries, len(LEVELS)))
+            for order in self.orders:
+                f.write(array('I', order).tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, store: Pronunciations, path: str = INDEX_PATH) -> 'RhymeIndex':
+        """
+        Map an index saved with save().
+
+        Raises ValueError if the file is of another format version or was built from other pronunciations.
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n_entries, n_levels = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION or n_entries != store.n_entries or n_levels != len(LEVELS):
+            buffer.close()
+            raise ValueError(f'{path} is not a version {VERSION} rhyme index of these pronunciations')
+
+        view = memoryview(buffer)
+        orders = [view[HEADER.size + 4 * n_entries * i:HEADER.size + 4 * n_entries * (i + 1)].cast('I')
+                  for i in range(n_levels)]
+        return cls(store, orders, buffer=buffer)
+
+    def pronunciations(self, word: str) -> List[Tuple[str, ...]]:
+        """All pronunciations of the word as phoneme names."""
+        return self.store.pronunciations(word)
+
+    def rhymes(self, pron: Sequence[str], level: int) -> List[str]:
+        """Words with a pronunciation whose last `level` phonemes equal those of pron."""
+        name_ids = self.store.name_ids
+        if any(p not in name_ids for p in pron[-level:]):
+            return []
+        key = bytes(name_ids[p] for p in pron[-level:])
+        order = self.orders[LEVELS.index(level)]
+
+        def suffix(e):
+            return bytes(self.store.entry(order[e])[-level:])
+
+        # Lower and upper bound of the entries with this suffix.
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if suffix(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        start, hi = lo, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if suffix(mid) <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        words = dict.fromkeys(self.store.entry_words[order[e]] for e in range(start, lo))
+        return [self.store.word(i) for i in words]
+
+
+_INDEX = None
+
+
+def get_rhyme_index() -> RhymeIndex:
+    """The rhyme index of this process, built over the shared pronunciations and saved on first use."""
+    global _INDEX
+    if _INDEX is None:
+        store = get_pronunciations()
+        try:
+            _INDEX = RhymeIndex.load(store)
+        except (FileNotFoundError, ValueError):
+            _INDEX = RhymeIndex.build(store)
+            _INDEX.save()
+    return _INDEX
+
+
+if __name__ == '__main__':
+    index = RhymeIndex.build(get_pronunciations())
+    index.save()
+    print(f'{len(index.store)} words, {index.store.n_entries} pronunciations')
@@ -0,0 +1,66 @@
+from functools import lru_cache
+from typing import Iterable, Tuple
+import re
+
+import numpy as np
+
+from roses.modules.rhyme_index import get_rhyme_index # works with main.py
+# from modules.rhyme_index import get_rhyme_index # works with roses.py
+
+VOWEL_GROUPS = re.compile(r'[aeiouy]+')
+PUNCTUATION = re.compile(r"[^\w\s'-]")
+# Longest stress pattern kept in a mask, counted from the end of the line
+MASK_BITS = 64
+
+
+def estimate_syllables(word: str) -> int:
+    """Syllables of a word not in cmudict, estimated from its vowel groups and a silent final e."""
+    word = word.lower()
+    groups = len(VOWEL_GROUPS.findall(word))
+    if word.endswith('e') and not word.endswith('le') and groups > 1:
+        groups -= 1
+    return max(1, groups)
+
+
+@lru_cache(maxsize=65536)
+def stress(word: str) -> str:
+    """
+    Stress pattern of a word, a digit per syllable: 0 unstressed, 1 primary and 2 secondary stress.
+
+    Taken from the first cmudict pronunciation, words not in cmudict get an
+    estimated number of syllables with the stress on the first one.
+    """
+    pronunciations = get_rhyme_index().pronunciations(word.lower())
+    if pronunciations:
+        return ''.join(phoneme[-1] for phoneme in pronunciations[0] if phoneme[-1].isdigit())
+    return '1' + '0' * (estimate_syllables(word) - 1)
+
+
+def syllable_count(word: str) -> int:
+    return len(stress(word))
+
+
+@lru_cache(maxsize=65536)
+def line_stress(line: str) -> str:
+    """Stress pattern of a line, the stress patterns of its words one after the other."""
+    return ''.join(stress(word) for word in PUNCTUATION.sub('', line).split())
+
+
+def line_syllables(line: str) -> int:
+    return len(line_stress(line))
+
+
+def stress_mask(pattern: str) -> int:
+    """Bit k is set if syllable k from the end is stressed, for the last MASK_BITS syllables."""
+    mask = 0
+    for syllable in pattern[-MASK_BITS:]:
+        mask = (mask << 1) | (syllable != '0')
+    return mask
+
+
+def stress_columns(lines: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Syllable counts and stress masks of the lines, as arrays for bulk scoring."""
+    patterns = [line_stress(line) for line in lines]
+    syllables = np.fromiter((len(pattern) for pattern in patterns), dtype=np.int64, count=len(patterns))
+    masks = np.fromiter((stress_mask(pattern) for pattern in patterns), dtype=np.uint64, count=len(patterns))
+    return syllables, masks
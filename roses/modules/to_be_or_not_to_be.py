@@ -1,15 +1,14 @@
 from typing import Tuple
-import inflect
+from resources.inflection import is_plural, plural_verb
 
 
 def fit_verb(word_pair: Tuple[str, str], verb: str):
     """
     Fits the verb to the word pair.
     """
-    p = inflect.engine()
-    if p.singular_noun(word_pair[0]) == False:
+    if not is_plural(word_pair[0]):
         return verb
-    return p.plural_verb(verb)
+    return plural_verb(verb)
 
 
 # For testing
@@ -0,0 +1,92 @@
+from typing import Dict, List, Sequence, Tuple
+import string
+
+import numpy as np
+
+from roses.utils import read_json_file # works with main.py
+from roses.modules.rhyme_index import get_rhyme_index # works with main.py
+from roses.modules.syllables import stress_columns # works with main.py
+# from utils import read_json_file # works with roses.py
+# from modules.rhyme_index import get_rhyme_index # works with roses.py
+# from modules.syllables import stress_columns # works with roses.py
+
+VERSES_FILE = "data/bible_kjv_wrangled.json"
+PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
+def last_word(sentence: str) -> str:
+    """Normalised last word of a sentence, without punctuation and lower cased."""
+    return sentence.translate(PUNCTUATION).strip().split(' ')[-1].lower()
+
+
+class VerseStore:
+    """
+    Verses indexed by their last word and by the rhyme class of their last word.
+
+    The rhyme class of a word at a given level is the last `level` phonemes of
+    its first pronunciation, so verses that rhyme with a word are found with
+    one lookup instead of a scan over all verses.
+    """
+
+    def __init__(self, data: Dict[str, str]):
+        self.keys = list(data)
+        self.sentences = list(data.values())
+        self.last_words = [last_word(sentence) for sentence in self.sentences]
+        self.by_last_word: Dict[str, List[int]] = {}
+        for i, word in enumerate(self.last_words):
+            self.by_last_word.setdefault(word, []).append(i)
+        self._by_rhyme_class: Dict[Tuple[int, Tuple[str, ...]], List[int]] = {}
+        self._indexed_levels = set()
+        # Syllable counts and stress masks of all verses, for bulk scoring
+        self.syllables, self.masks = stress_columns(self.sentences)
+
+    def __len__(self):
+        return len(self.sentences)
+
+    def line(self, i: int) -> str:
+        return self.sentences[i]
+
+    def stress_columns(self, ids: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Syllable counts and stress masks of the verses as arrays."""
+        ids = np.asarray(ids, dtype=np.int64)
+        return self.syllables[ids], self.masks[ids]
+
+    def ending_with(self, word: str) -> List[int]:
+        """Ids of the verses whose last word is word."""
+        return self.by_last_word.get(word.lower(), [])
+
+    @staticmethod
+    def rhyme_class(word: str, level: int) -> Tuple[str, ...]:
+        """Last `level` phonemes of the first pronunciation of word, None if it has none."""
+        pronunciations = get_rhyme_index().pronunciations(word)
+        if not pronunciations:
+            return None
+        return pronunciations[0][-level:]
+
+    def _index_level(self, level: int):
+        if level in self._indexed_levels:
+            return
+        for word, ids in self.by_last_word.items():
+            rhyme_class = self.rhyme_class(word, level)
+            if rhyme_class is not None:
+                self._by_rhyme_class.setdefault((level, rhyme_class), []).extend(ids)
+        self._indexed_levels.add(level)
+
+    def rhyming_with(self, word: str, level: int) -> List[int]:
+        """Ids of the verses whose last word is in the rhyme class of word at the given level."""
+        self._index_level(level)
+        rhyme_class = self.rhyme_class(word, level)
+        if rhyme_class is None:
+            return []
+        return self._by_rhyme_class.get((level, rhyme_class), [])
+
+
+_STORE = None
+
+
+def get_verse_store() -> VerseStore:
+    """The verse store of this process, read and indexed on first use."""
+    global _STORE
+    if _STORE is None:
+        _STORE = VerseStore(read_json_file(VERSES_FILE))
+    return _STORE
@@ -3,28 +3,66 @@
 Should contain initialize- and create-functions.
 """
 import argparse
+import contextlib
+import heapq
+import itertools
+import multiprocessing
 import random
 import json
+import sys
+import time
 
 ## These imports work with main.py
-from roses.modules.alter_word_pairs import generate_word_pairs
-from roses.modules.best_rhymes import generate_rhyming_words
-from roses.modules.choose_lines import find_lines
-from roses.modules.do_magic import alter_rest
-from roses.modules.expand_poem import fill_and_create_text
+from roses.modules.alter_word_pairs import generate_word_pairs, iter_word_pairs
+from roses.modules.best_rhymes import generate_rhyming_words, iter_rhyming_words
+from roses.modules.choose_lines import find_lines, iter_lines
+from roses.modules.line_store import get_line_store
+from roses.modules.rhyme_index import get_rhyme_index
+from roses.modules.verse_store import get_verse_store
+from roses.modules.do_magic import alter_rest, iter_alter_rest
+from roses.modules.expand_poem import fill_and_create_text, iter_poems
 from roses.modules.fill_evaluations import evaluate_poems
+from roses.modules.novelty import get_novelty_index
 from roses.utils import read_json_file
 
 ## These imports work with roses.py
-# from modules.alter_word_pairs import generate_word_pairs
-# from modules.best_rhymes import generate_rhyming_words
-# from modules.choose_lines import find_lines
-# from modules.do_magic import alter_rest
-# from modules.expand_poem import fill_and_create_text
+# from modules.alter_word_pairs import generate_word_pairs, iter_word_pairs
+# from modules.best_rhymes import generate_rhyming_words, iter_rhyming_words
+# from modules.choose_lines import find_lines, iter_lines
+# from modules.line_store import get_line_store
+# from modules.rhyme_index import get_rhyme_index
+# from modules.verse_store import get_verse_store
+# from modules.do_magic import alter_rest, iter_alter_rest
+# from modules.expand_poem import fill_and_create_text, iter_poems
 # from modules.fill_evaluations import evaluate_poems
+# from modules.novelty import get_novelty_index
 # from utils import read_json_file
 
 DATA_FOLDER = 'data/'
+CANDIDATE_BUDGET = 5000
+BATCH_SIZE = 256
+
+
+def interleave(iterables):
+    """Round robin over the iterables until all of them are exhausted."""
+    iterators = [iter(iterable) for iterable in iterables]
+    while iterators:
+        alive = []
+        for iterator in iterators:
+            for item in iterator:
+                yield item
+                alive.append(iterator)
+                break
+        iterators = alive
+
+
+_worker_creator = None
+
+
+def _best_of_shard(args):
+    """Best poems of a shard of the word pairs in a worker process."""
+    return _worker_creator.best(*args)
+
 
 class PoemCreator:
 
@@ -33,10 +71,23 @@ class PoemCreator:
         when create-function is called.
 
         Only keyword arguments are supported in config.json
+
+        :param int candidate_budget:
+            Most candidate poems evaluated per create call, None to evaluate all of them.
+        :param float good_enough:
+            Stop as soon as the requested number of poems all have at least this evaluation, None to never stop early.
+        :param int batch_size:
+            Number of candidate poems evaluated at once.
+        :param int workers:
+            Number of processes the word pairs are sharded over, 1 to create in this process.
         """
         print("Group Roses initialize.")
         poems = []
         self.poems = poems
+        self.candidate_budget = kwargs.get('candidate_budget', CANDIDATE_BUDGET)
+        self.good_enough = kwargs.get('good_enough')
+        self.batch_size = kwargs.get('batch_size', BATCH_SIZE)
+        self.workers = kwargs.get('workers', 1)
 
         # Each creator should have domain specified: title, poetry, music, image, etc.
         self.domain = 'poetry'
@@ -54,12 +105,69 @@ class PoemCreator:
         )
         return self.poems
 
+    def stream(self, emotion, word_pairs):
+        """Lazy poem generator.
+
+        Every word pair is its own chain of generator stages, and the chains are interleaved so that all word pairs
+        contribute candidates before any budget runs out.
+        """
+        return interleave(
+            iter_poems(emotion, iter_alter_rest(emotion, iter_lines(emotion, iter_rhyming_words(emotion, [partial]))))
+            for partial in iter_word_pairs(emotion, word_pairs)
+        )
+
     def evaluate(self, emotion, word_pairs, poems):
         """Evaluate poem.
         """
         evaluations = evaluate_poems(emotion, word_pairs, poems)
         return evaluations
 
+    def best(self, emotion, shard, word_pairs, number_of_artifacts, budget, good_enough):
+        """Best (evaluation, poem) pairs of the poems generated from the shard of the word pairs, best last.
+
+        Candidates are evaluated in batches against all word pairs and only the best *number_of_artifacts* are kept.
+        Stops after *budget* candidates, or once all kept poems have at least the evaluation *good_enough*.
+        """
+        # Min-heap of the best (evaluation, tie breaker, poem) seen so far
+        best = []
+        tie_breaker = itertools.count()
+        candidates = itertools.islice(self.stream(emotion, shard), budget)
+        while True:
+            batch = list(itertools.islice(candidates, self.batch_size))
+            if not batch:
+                break
+            for poem, score in self.evaluate(emotion, word_pairs, batch):
+                item = (score, next(tie_breaker), poem)
+                if len(best) < number_of_artifacts:
+                    heapq.heappush(best, item)
+                else:
+                    heapq.heappushpop(best, item)
+            if good_enough is not None and len(best) == number_of_artifacts and best[0][0] >= good_enough:
+                break
+        return [(score, poem) for score, _, poem in sorted(best)]
+
+    def best_parallel(self, emotion, word_pairs, number_of_artifacts, budget, good_enough):
+        """Like best, with the word pairs sharded over worker processes and the best of every shard merged.
+
+        The indexes are loaded before the workers are forked, so that they share the rhyme index, verse or line
+        store and novelty index instead of loading their own copies.
+        """
+        global _worker_creator
+        _worker_creator = self
+        get_rhyme_index()
+        get_line_store() or get_verse_store()
+        get_novelty_index()
+
+        n_shards = min(self.workers, len(word_pairs))
+        shard_budget = None if budget is None else -(-budget // n_shards)
+        shards = [(emotion, word_pairs[i::n_shards], word_pairs, number_of_artifacts, shard_budget, good_enough)
+                  for i in range(n_shards)]
+        # Forked workers would otherwise all draw the same random lines
+        with multiprocessing.get_context('fork').Pool(n_shards, initializer=random.seed) as pool:
+            results = pool.map(_best_of_shard, shards)
+        return sorted(heapq.nlargest(number_of_artifacts, itertools.chain.from_iterable(results),
+                                     key=lambda x: x[0]), key=lambda x: x[0])
+
     def create(self, emotion, word_pairs, number_of_artifacts=10, **kwargs):
         """Create artifacts in the group's domain.
 
@@ -89,22 +197,83 @@ class PoemCreator:
 
         """
         print("Group Roses create with input args: {} {}".format(emotion, word_pairs))
-        poems = self.evaluate(emotion, word_pairs,
-                              self.generate(emotion, word_pairs))
-        poems.sort(key=lambda x: x[1])
-        return list(map(lambda x: ('\n'.join(x[0]), {'evaluation': x[1]}), poems[0:number_of_artifacts]))
+        budget = kwargs.get('candidate_budget', self.candidate_budget)
+        good_enough = kwargs.get('good_enough', self.good_enough)
+
+        if self.workers > 1 and len(word_pairs) > 1:
+            best = self.best_parallel(emotion, word_pairs, number_of_artifacts, budget, good_enough)
+        else:
+            best = self.best(emotion, word_pairs, word_pairs, number_of_artifacts, budget, good_enough)
+        best.reverse()
+
+        # Remember the returned poems so that later ones are scored less novel when alike
+        novelty_index = get_novelty_index()
+        novelty_index.add([poem for _, poem in best])
+        novelty_index.save()
+        return [('\n'.join(poem), {'evaluation': score}) for score, poem in best]
+
+
+def run_batch(poem_creator, inputs, output, number_of_artifacts):
+    """Create poems for every JSON line of inputs and write a JSON line of results to output as each completes.
+
+    Every input line is an object with 'emotion', 'word_pairs' and optionally 'number_of_artifacts'. Returns the
+    throughput statistics, which are also written to stderr.
+    """
+    stats = {'inputs': 0, 'poems': 0, 'seconds': 0.}
+    start = time.perf_counter()
+    for line in inputs:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        input_start = time.perf_counter()
+        # Progress messages of the creator would corrupt the JSON lines
+        with contextlib.redirect_stdout(sys.stderr):
+            poems = poem_creator.create(request['emotion'], [tuple(pair) for pair in request['word_pairs']],
+                                        request.get('number_of_artifacts', number_of_artifacts))
+        seconds = time.perf_counter() - input_start
+        output.write(json.dumps({
+            'input': stats['inputs'],
+            'emotion': request['emotion'],
+            'poems': [{'poem': poem, 'evaluation': metadata['evaluation']} for poem, metadata in poems],
+            'seconds': round(seconds, 4),
+        }) + '\n')
+        output.flush()
+        stats['inputs'] += 1
+        stats['poems'] += len(poems)
+
+    stats['seconds'] = time.perf_counter() - start
+    if stats['seconds'] > 0:
+        stats['inputs_per_second'] = stats['inputs'] / stats['seconds']
+        stats['poems_per_second'] = stats['poems'] / stats['seconds']
+    print(json.dumps(stats), file=sys.stderr)
+    return stats
 
 
 if __name__ == '__main__':
-    poem_creator = PoemCreator()
     parser = argparse.ArgumentParser()
-    parser.add_argument('emotion', help='Emotion for poem.')
+    parser.add_argument('emotion', nargs='?', help='Emotion for poem.')
     parser.add_argument(
-        'word_pairs', help='File for word pairs. Json list of lists')
+        'word_pairs', nargs='?', help='File for word pairs. Json list of lists')
     parser.add_argument(
-        'num_poems', help='Number of poems to output.', type=int)
+        'num_poems', nargs='?', help='Number of poems to output.', type=int)
+    parser.add_argument(
+        '--batch', help='JSON lines file of {"emotion", "word_pairs", "number_of_artifacts"} inputs, - for stdin. '
+                        'Writes a JSON line of poems per input to stdout.')
+    parser.add_argument(
+        '--workers', type=int, default=1, help='Number of processes the word pairs are sharded over.')
     args = parser.parse_args()
-    word_pairs = read_json_file(DATA_FOLDER +args.word_pairs)
-    word_pairs = [tuple(word_pair) for word_pair in word_pairs]
-    for poem in poem_creator.create(args.emotion, [('human', 'boss'), ('animal', 'legged')], args.num_poems):
-        print(f'----Poem evaluated {poem[1]}\n{poem[0]}\n----')
+
+    if args.batch:
+        with contextlib.redirect_stdout(sys.stderr):
+            poem_creator = PoemCreator(workers=args.workers)
+        inputs = sys.stdin if args.batch == '-' else open(args.batch)
+        with inputs:
+            run_batch(poem_creator, inputs, sys.stdout, args.num_poems or 10)
+    else:
+        if args.emotion is None or args.word_pairs is None or args.num_poems is None:
+            parser.error('emotion, word_pairs and num_poems are required without --batch')
+        poem_creator = PoemCreator(workers=args.workers)
+        word_pairs = read_json_file(DATA_FOLDER +args.word_pairs)
+        word_pairs = [tuple(word_pair) for word_pair in word_pairs]
+        for poem in poem_creator.create(args.emotion, word_pairs, args.num_poems):
+            print(f'----Poem evaluated {poem[1]}\n{poem[0]}\n----')
@@ -0,0 +1,179 @@
+import heapq
+import math
+import random
+import numpy as np
+
+try:
+    from .evaluator import PUNCTUATION
+except ImportError:
+    from evaluator import PUNCTUATION
+
+
+class Hypothesis:
+    """Partial title in the beam, with the running sums its score is computed from."""
+
+    __slots__ = ('state', 'tokens', 'logprob', 'sentiment', 'phonemes', 'n_phonemes', 'chars', 'digits', 'score')
+
+    def __init__(self, state, tokens, logprob, sentiment, phonemes, n_phonemes, chars, digits):
+        self.state = state
+        self.tokens = tokens
+        self.logprob = logprob
+        self.sentiment = sentiment
+        self.phonemes = phonemes
+        self.n_phonemes = n_phonemes
+        self.chars = chars
+        self.digits = digits
+        self.score = 0.
+
+
+class BeamSearch:
+    """
+    Guided title generation over a compiled Markov chain.
+
+    Instead of sampling a title and rejecting it after evaluation, a beam of
+    partial titles is grown one token at a time. Every partial title is
+    scored with incremental versions of the evaluator's sentiment,
+    alliteration and length terms, novelty is assumed to be perfect as in
+    Evaluator.cascade, and only the best partial titles are extended.
+    Edges are sampled rather than enumerated, so that repeated searches
+    produce different titles.
+
+    Two words of every title are replaced with slots afterwards, see
+    templates.make_template. choose_template picks the slots so that the
+    words kept as fixed text are the ones that score best.
+    """
+
+    def __init__(self, markov, evaluator, emotion, width=16, branch=4, max_tokens=12, fluency=0.05, rng=random):
+        """
+        Args:
+            markov (MarkovChain) : Chain to search, generated titles in its corpus are skipped.
+            evaluator (Evaluator) : Evaluator whose lexicon, phonemes and preferences are used for scoring.
+            emotion (str) : Emotion the titles should convey.
+            width (int) : Number of partial titles kept after every step.
+            branch (int) : Number of edges sampled per partial title.
+            max_tokens (int) : Longest title searched for.
+            fluency (float) : Weight of the average token log probability in the score.
+        """
+        self.markov = markov
+        self.evaluator = evaluator
+        self.goal = np.array([int(e == emotion) for e in evaluator.emotions])
+        self.width = width
+        self.branch = branch
+        self.max_tokens = max_tokens
+        self.fluency = fluency
+        self.rng = rng
+        # Sentiment row, phoneme mask and phoneme count by word
+        self._words = {}
+
+    def _word(self, word):
+        if word not in self._words:
+            lexicon = self.evaluator.lexicon
+            row = lexicon.index.get(word.lower())
+            sentiment = np.zeros(len(lexicon.EMOTIONS)) if row is None else lexicon.matrix[row].astype(float)
+            phonemes = self.evaluator.phonemes.lookup(word.lower().translate(PUNCTUATION))
+            mask = 0
+            for phoneme in phonemes or ():
+                mask |= 1 << phoneme
+            self._words[word] = (word, sentiment, mask, len(phonemes or ()), sum(c.isdigit() for c in word))
+        return self._words[word]
+
+    def _token(self, chain, token_id):
+        return self._word(chain.vocab[token_id])
+
+    def _evaluation(self, n, sentiment, phonemes, n_phonemes):
+        """Evaluator.cascade of n words from their summed sentiment, phoneme mask and phoneme count."""
+        evaluator = self.evaluator
+        w_senti = evaluator.weight_sentiment(evaluator.get_sentiment_score(self.goal, sentiment / n))
+        ratio = evaluator.get_alliteration_ratio(phonemes, n_phonemes)
+        w_alli = evaluator.weight_alliteration(evaluator.get_alliteration_score(ratio))
+        return evaluator.combine(evaluator.pref_novelty, w_alli, w_senti)
+
+    def _score(self, h):
+        n = len(h.tokens)
+        return self._evaluation(n, h.sentiment, h.phonemes, h.n_phonemes) + self.fluency * h.logprob / n
+
+    def score_words(self, words):
+        """Evaluation of a title made of the words, as scored during the search but without the fluency term."""
+        if not words:
+            return 0.
+        sentiment = np.zeros(len(self.goal))
+        phonemes = n_phonemes = 0
+        for word in words:
+            _, word_sentiment, mask, word_phonemes, _ = self._word(word)
+            sentiment = sentiment + word_sentiment
+            phonemes |= mask
+            n_phonemes += word_phonemes
+        return self._evaluation(len(words), sentiment, phonemes, n_phonemes)
+
+    def choose_template(self, templates):
+        """The template whose fixed text scores best, see templates.make_template."""
+        def fixed_words(template):
+            return [word for token in template if not token.startswith('[[') for word in token.split()]
+        return max(templates, key=lambda template: self.score_words(fixed_words(template)))
+
+    def _edges(self, chain, state):
+        lo, hi = chain.offsets[state], chain.offsets[state + 1]
+        total = chain.cumweights[hi - 1]
+        edges = set()
+        for _ in range(self.branch):
+            edges.add(chain.sample_edge(state, self.rng))
+        for e in edges:
+            weight = chain.cumweights[e] - (chain.cumweights[e - 1] if e > lo else 0)
+            yield e, math.log(weight / total)
+
+    def search(self):
+        """
+        Run one beam search.
+
+        Returns:
+            list of tuple : (score, title) of the complete titles found, best first.
+        """
+        chain = self.markov.compiled
+        beam = [Hypothesis(0, (), 0., np.zeros(len(self.goal)), 0, 0, -1, 0)]
+        complete = {}
+        for _ in range(self.max_tokens):
+            expansions = []
+            for h in beam:
+                for e, logprob in self._edges(chain, h.state):
+                    state = chain.next_states[e]
+                    if state < 0:
+                        if h.tokens:
+                            complete[' '.join(h.tokens)] = h.score
+                        continue
+                    word, sentiment, mask, n_phonemes, digits = self._token(chain, chain.targets[e])
+                    # Hard limits of Evaluator.prefilter
+                    if h.chars + 1 + len(word) > 55 or h.digits + digits > 3:
+                        continue
+                    h2 = Hypothesis(state, h.tokens + (word,), h.logprob + logprob, h.sentiment + sentiment,
+                                    h.phonemes | mask, h.n_phonemes + n_phonemes, h.chars + 1 + len(word),
+                                    h.digits + digits)
+                    h2.score = self._score(h2)
+                    expansions.append(h2)
+            if not expansions:
+                break
+            beam = heapq.nlargest(self.width, expansions, key=lambda h: h.score)
+
+        return sorted(((score, title) for title, score in complete.items()
+                       if title not in self.markov.corpus), reverse=True)
+
+    def generate_many(self, n):
+        """
+        Generate up to n distinct titles, taking the best few of every search.
+
+        Searches favour likely paths, which often lead to titles of the
+        corpus only; a title is sampled from the chain for those instead.
+        """
+        titles = []
+        seen = set()
+        for _ in range(n):
+            found = [title for _, title in self.search()[:max(1, self.width // 4)]]
+            if not found:
+                title = self.markov.generate()
+                found = [] if title is None else [title]
+            for title in found:
+                if title not in seen:
+                    seen.add(title)
+                    titles.append(title)
+            if len(titles) >= n:
+                break
+        return titles[:n]
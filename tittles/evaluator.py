@@ -1,14 +1,31 @@
-import cmudict
 import pickle
 import os
 import random
-import csv
-from operator import add
 import math
+import sys
+from collections import Counter
+import numpy as np
+
+try:
+    from resources.pronunciations import get_pronunciations
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    from resources.pronunciations import get_pronunciations
+
+try:
+    from .lexicon import SentimentLexicon
+    from .titleset import TitleSet, normalise
+except ImportError:
+    from lexicon import SentimentLexicon
+    from titleset import TitleSet, normalise
 
 import logging
 logger = logging.getLogger(__name__)
 
+# Punctuation ignored when looking up the pronunciation of a word
+PUNCTUATION = str.maketrans('', '', ":';.!?")
+
+
 class Evaluator():
     TITLE_DUMP_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data", "titles.pickle")
     SENTIMENT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data", "EmotionLexicon.txt")
@@ -16,7 +33,7 @@ class Evaluator():
     def __init__(self):
         self.emotions = ['anger', 'disgust', 'fear', 'happiness', 'sadness', 'surprise']
 
-        self.cmudict = cmudict.dict()
+        self.phonemes = get_pronunciations()
 
         self.title_bank = None
 
@@ -35,21 +52,17 @@ class Evaluator():
             with open(self.TITLE_DUMP_PATH, "rb") as f:
                 self.title_bank = pickle.load(f)
 
-        #Read content for the sentiment dictionary
-        self.sentimentDictionary = {}
-        with open(self.SENTIMENT_LEXICON_PATH) as emotionLexicon:
-            lexicon = csv.reader(emotionLexicon, delimiter='\t')
-            word = ""
-            values = {}
-            for row in lexicon:
-                if word != row[0]:
-                    self.sentimentDictionary[word] = values
-                    word = row[0]
-                    values = {}
-                values[row[1]] = row[2]
+        # Normalised titles of the bank for fast exact-match checks.
+        self.known_titles = TitleSet(normalise(info["title"]) for info in self.title_bank.values())
+
+        # Sentiment lexicon, compiled to a matrix on first use and mapped from disk afterwards
+        self.lexicon = SentimentLexicon.load(self.SENTIMENT_LEXICON_PATH)
 
         self.pref_novelty, self.pref_alliteration = self.__learn_preference(sample_size=100)
 
+        # Titles rejected by evaluate with a threshold, by the stage they were rejected at
+        self.rejections = Counter()
+
 
     def __learn_preference(self, sample_size=100):
         """
@@ -93,7 +106,7 @@ class Evaluator():
 
         # print("Learning alliteration preference for titles")
 
-        alliterations = [self.eval_alliteration(self.title_bank[tid]["title"].strip().split(" ")) for tid in sample]
+        alliterations = self.eval_alliteration_many([self.title_bank[tid]["title"].strip().split(" ") for tid in sample])
 
 
         # Find combination for the preferences
@@ -190,6 +203,7 @@ class Evaluator():
                 key = candidate
 
         self.title_bank[key] = {"title": title}
+        self.known_titles.add(normalise(title))
         return True
 
 
@@ -204,7 +218,7 @@ class Evaluator():
         with open(self.TITLE_DUMP_PATH, "wb") as f:
             pickle.dump(self.title_bank, f)
 
-    def edit_distance(self, phenotype, weights=(1, 1, 1)):
+    def edit_distance(self, phenotype, weights=(1, 1, 1), stop_below=None):
         """
         Calculate the shortest levenshtein distance between phenotype and known titles.
 
@@ -213,13 +227,14 @@ class Evaluator():
             title_bank (dict) : Known titles, needs to have dictionaries as values, and those disctionaries need to have
                                 'title' key.
             weights (tuple of floats) : Weights for different operations. In order: Delete, Insert, Substitute
+            stop_below (float) : Stop searching as soon as a distance below this is found.
 
         Returns:
-            int : Shortest edit distance.
+            int : Shortest edit distance, or the first distance below stop_below.
         """
 
-        # Checking for exact match from the dictionary is fast
-        if phenotype in self.title_bank:
+        # Checking for exact match from the title set is fast
+        if normalise(phenotype) in self.known_titles:
             return 0
 
         closest = 1000
@@ -232,59 +247,129 @@ class Evaluator():
 
             levenshtein = self.__iterative_levenshtein(phenotype.strip(), b_info["title"].strip(), weights)
             closest = min(closest, levenshtein)
+            if stop_below is not None and closest < stop_below:
+                break
 
         return closest
 
-    def evaluate(self, title, emotion):
+    def prefilter(self, title):
+        """
+        Cheap checks that refuse a title before any evaluation scheme is run.
+
+        Args:
+            title (list) : list of words forming the title.
+
+        Returns:
+            bool : False if the title is refused.
+        """
+        # Refuse titles that are not accepted by eval_numbers.
+        if self.eval_numbers(" ".join(title)) == 0.0:
+            logger.debug("too many numbers in title")
+            return False
+        if len(" ".join(title)) > 55:
+            logger.debug("title too long")
+            return False
+        return True
+
+    def evaluate(self, title, emotion, threshold=None):
         """Runs the different evaluation schemes, which return values between 0 and 1, and returns an average over them.
 
+        The schemes run from the cheapest to the most expensive. With a threshold, evaluation stops as soon as
+        the title cannot reach it any more, see cascade. Rejections are counted per stage in self.rejections.
+
         Args:
             title (list) : list of words forming the title when.
+            emotion (str) : Emotion the title should convey.
+            threshold (float) : Score the caller accepts titles at, or None to always evaluate fully.
 
         Returns:
-            float : Weighted average of the different evaluations.
+            float : Weighted average of the different evaluations, or an upper bound of it below threshold.
         """
+        result, stage = self.cascade(title, emotion, threshold)
+        if stage is not None:
+            self.rejections[stage] += 1
+        return result
+
+    def cascade(self, title, emotion, threshold=None):
+        """
+        Evaluation cascade behind evaluate.
 
+        An upper bound of the final score is kept after every stage, assuming the best value for the stages not
+        run yet. The title is abandoned once the bound falls below threshold.
+
+        Returns:
+            tuple : Score or its upper bound, and the stage the title was rejected at or None.
+        """
         logger.debug("input " + str(title))
 
-        # Refuse titles that are not accepted by eval_numbers.
         # Allows to skip expensive novelty checking
-        if self.eval_numbers(" ".join(title)) == 0.0:
-            logger.debug("too many numbers in title")
-            return 0.
-        if len(" ".join(title)) > 55:
-            logger.debug("title too long")
-            return 0.
+        if not self.prefilter(title):
+            return 0., 'prefilter'
 
-        nov = self.eval_novelty(" ".join(title))
-        w_nov = nov*self.pref_novelty
-        logger.debug(f"novelty {nov}")
-        logger.debug(f"weighted novelty {w_nov}")
+        senti = self.eval_sentiment(title, emotion)
+        w_senti = self.weight_sentiment(senti)
+        logger.debug(f"sentiment {senti}")
+        logger.debug(f"weighted sentiment {w_senti}")
+
+        bound = self.combine(self.pref_novelty, self.pref_alliteration, w_senti)
+        if threshold is not None and bound < threshold:
+            logger.debug(f"rejected after sentiment, bound {bound}")
+            return bound, 'sentiment'
 
         alli = self.eval_alliteration(title)
-        w_alli = alli*self.pref_alliteration
+        w_alli = self.weight_alliteration(alli)
         logger.debug(f"alliteration {alli}")
         logger.debug(f"weighted alliteration {w_alli}")
 
-        # Sentiment values seem to be consistently around 0.6, scale up closer to one.
-        # Still make sure, that value is not over 1.0
-        senti = self.eval_sentiment(title, emotion)
-        w_senti = min(1.0, senti*1.4)
-        logger.debug(f"sentiment {senti}")
-        logger.debug(f"weighted sentiment {w_senti}")
+        bound = self.combine(self.pref_novelty, w_alli, w_senti)
+        if threshold is not None and bound < threshold:
+            logger.debug(f"rejected after alliteration, bound {bound}")
+            return bound, 'alliteration'
+
+        # Lowest novelty that can still reach the threshold
+        minimum = None
+        if threshold is not None and self.pref_novelty > 0:
+            minimum = (2*(threshold - w_senti*0.5) - w_alli) / self.pref_novelty
 
-        # Novelty & Alliteration are weighted against each other to result in 1.0 weight together.
-        # Sentiment has 1.0 weight at the moment, so scale everything down in same fractions, so that output range [0,1]
-        result = (w_nov + w_alli)*0.5 + (w_senti*0.5)
+        nov = self.eval_novelty(" ".join(title), minimum)
+        w_nov = nov*self.pref_novelty
+        logger.debug(f"novelty {nov}")
+        logger.debug(f"weighted novelty {w_nov}")
+
+        result = self.combine(w_nov, w_alli, w_senti)
         logger.debug(f'final evaluation {result}')
 
-        return result
+        if threshold is not None and result < threshold:
+            return result, 'novelty'
+        return result, None
 
-    def eval_novelty(self, title):
+    def weight_sentiment(self, senti):
+        """Sentiment values seem to be consistently around 0.6, scale up closer to one.
+        Still make sure, that value is not over 1.0
+        """
+        return min(1.0, senti*1.4)
+
+    def weight_alliteration(self, alli):
+        return alli*self.pref_alliteration
+
+    def combine(self, w_nov, w_alli, w_senti):
+        """Novelty & Alliteration are weighted against each other to result in 1.0 weight together.
+        Sentiment has 1.0 weight at the moment, so scale everything down in same fractions, so that output range [0,1]
+        """
+        return (w_nov + w_alli)*0.5 + (w_senti*0.5)
+
+    def eval_novelty(self, title, minimum=None):
+        """
+        Novelty of the title as its edit distance to the closest known title, scaled by the title length.
+
+        Args:
+            minimum (float) : Novelty the caller needs, the search stops once the novelty is known to be lower.
+        """
         if self.title_bank is None:
             return 0.8
         else:
-            dist = self.edit_distance(title, (1, 1, 1))
+            stop_below = None if minimum is None else minimum*len(title)
+            dist = self.edit_distance(title, (1, 1, 1), stop_below)
             # Scale with the title length
             # Can be higher than 1 if weights are not all 1.
             dist = min(1.0, dist/len(title))
@@ -292,37 +377,51 @@ class Evaluator():
 
 
     def eval_alliteration(self, title):
-        unique_phonemes = []
-        title_length = 0
-
-        for word in title:
-
-            word = word.lower()
-            word = word.replace(":", "")
-            word = word.replace("'", "")
-            word = word.replace(";", "")
-            word = word.replace(";", "")
-            word = word.replace(".", "")
-            word = word.replace("!", "")
-            word = word.replace("?", "")
-
-            try:
-                phonemes = self.cmudict[word][0]
-                title_length += len(phonemes)
-                for phoneme in phonemes:
-                    if phoneme not in unique_phonemes:
-                        unique_phonemes.append(phoneme)
-            except IndexError:
-                #word was not in dict
-                continue
+        return self.eval_alliteration_many([title])[0]
 
-        try:
-            ratio = len(unique_phonemes) / title_length
-        except ZeroDivisionError:
-            ratio = 0.
+    def eval_alliteration_many(self, titles):
+        """
+        Alliteration scores of a batch of titles, see get_alliteration_score.
 
-        return self.get_alliteration_score(ratio)
+        Args:
+            titles (list of list of str) : Titles as lists of words.
 
+        Returns:
+            list of float : Alliteration score of each title.
+        """
+        # Phoneme ids are small, so the unique phonemes of a title fit in an int bitmask.
+        words = {}
+        for title in titles:
+            for word in title:
+                if word not in words:
+                    phonemes = self.phonemes.lookup(word.lower().translate(PUNCTUATION))
+                    if phonemes is None:
+                        #word was not in dict
+                        words[word] = (0, 0)
+                    else:
+                        mask = 0
+                        for phoneme in phonemes:
+                            mask |= 1 << phoneme
+                        words[word] = (mask, len(phonemes))
+
+        scores = []
+        for title in titles:
+            unique_phonemes = 0
+            title_length = 0
+            for word in title:
+                mask, length = words[word]
+                unique_phonemes |= mask
+                title_length += length
+
+            scores.append(self.get_alliteration_score(self.get_alliteration_ratio(unique_phonemes, title_length)))
+        return scores
+
+    def get_alliteration_ratio(self, unique_phonemes, title_length):
+        """Share of unique phonemes in a title, given as a bitmask of its unique phoneme ids and its phoneme count."""
+        try:
+            return bin(unique_phonemes).count('1') / title_length
+        except ZeroDivisionError:
+            return 0.
 
     def get_alliteration_score(self, ratio):
         """ A function that has it maximum = 1 when ratio is 1/2, meaning half of the phonemes in the
@@ -335,28 +434,30 @@ class Evaluator():
         Builds a vector of emotions in the title and compares that vector to the emotion in the input
         Each word gets a weight of 1/n, where n is the number of words in the title
         """
-        self.emotions = ['anger', 'disgust', 'fear', 'happiness', 'sadness', 'surprise']
-        goal_sentiment = list(map(lambda x: int(x == emotion), self.emotions))
-        self.emotions = ['anger', 'disgust', 'fear', 'joy', 'sadness', 'surprise']
-        title_sentiment = [0, 0, 0, 0, 0, 0]
-        for word in title:
-            sentiments = self.sentimentDictionary.get(word.lower(), None)
-            if sentiments is not None:
-                word_sentiment = list(map(lambda x: int(sentiments[x]), self.emotions))
-                title_sentiment = list(map(add, title_sentiment, word_sentiment))
-        title_sentiment = list(map(lambda x: x/len(title), title_sentiment))
-        return self.get_sentiment_vector_diff(goal_sentiment, title_sentiment)
-
-    def get_sentiment_vector_diff(self, goal, sentiment):
+        return float(self.eval_sentiment_many([title], emotion)[0])
+
+    def eval_sentiment_many(self, titles, emotion):
         """
-        Take squared difference of vectors
+        Vectorized eval_sentiment over a batch of titles.
+
+        Args:
+            titles (list of list of str) : Titles as lists of words.
+            emotion (str) : Goal emotion.
+
+        Returns:
+            numpy.ndarray : Sentiment score of each title.
         """
-        diff = 0
-        for i in range(len(self.emotions)):
-            diff += (goal[i] - sentiment[i])**2
-        #Normalize to range 0-1 and take complement, since small difference is good
-        return 1 - math.sqrt(diff)/math.sqrt(6)
+        goal = np.array([int(e == emotion) for e in self.emotions])
+        lengths = np.array([max(1, len(title)) for title in titles], dtype=float)
+        title_sentiment = self.lexicon.sums(titles) / lengths[:, None]
+        return self.get_sentiment_score(goal, title_sentiment)
 
+    def get_sentiment_score(self, goal, sentiment):
+        """
+        Sentiment score of mean emotion vectors (one, or one per row) against the goal emotion vector.
+        """
+        #Normalize to range 0-1 and take complement, since small difference is good
+        return 1 - np.sqrt(((goal - sentiment) ** 2).sum(axis=-1)) / math.sqrt(6)
 
     def eval_numbers(self, title):
         digits = 0
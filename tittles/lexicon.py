@@ -0,0 +1,91 @@
+import csv
+import os
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SentimentLexicon:
+    """
+    NRC emotion lexicon compiled into a (vocabulary x emotions) uint8 matrix.
+
+    The matrix is saved next to the source lexicon as .npy with the
+    vocabulary in a text file, one word per line in row order. Later loads
+    map the matrix from disk instead of parsing the lexicon again.
+    """
+
+    EMOTIONS = ['anger', 'disgust', 'fear', 'joy', 'sadness', 'surprise']
+
+    def __init__(self, words, matrix):
+        self.words = words
+        self.index = {word: i for i, word in enumerate(words)}
+        self.matrix = matrix
+
+    @staticmethod
+    def _compiled_paths(path):
+        base = os.path.splitext(path)[0]
+        return base + '.npy', base + '.vocab'
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load the compiled lexicon of path, compiling it first if it is missing or outdated.
+
+        Args:
+            path (str) : Tab separated word, emotion, 0/1 lexicon file.
+        """
+        matrix_path, vocab_path = cls._compiled_paths(path)
+        try:
+            if os.path.getmtime(matrix_path) >= os.path.getmtime(path):
+                with open(vocab_path, encoding='utf-8') as f:
+                    words = f.read().split('\n')
+                return cls(words, np.load(matrix_path, mmap_mode='r'))
+        except FileNotFoundError:
+            pass
+
+        lexicon = cls.compile(path)
+        lexicon.save(path)
+        return lexicon
+
+    @classmethod
+    def compile(cls, path):
+        """Parse the lexicon file into a matrix."""
+        logger.info('compiling sentiment lexicon {}'.format(path))
+        columns = {emotion: i for i, emotion in enumerate(cls.EMOTIONS)}
+        rows = {}
+        with open(path) as emotionLexicon:
+            for word, emotion, value in csv.reader(emotionLexicon, delimiter='\t'):
+                row = rows.setdefault(word, [0] * len(columns))
+                if emotion in columns:
+                    row[columns[emotion]] = int(value)
+        return cls(list(rows), np.array(list(rows.values()), dtype=np.uint8).reshape(-1, len(columns)))
+
+    def save(self, path):
+        matrix_path, vocab_path = self._compiled_paths(path)
+        np.save(matrix_path, self.matrix)
+        with open(vocab_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(self.words))
+
+    def sums(self, titles):
+        """
+        Summed emotion vectors of the words of each title.
+
+        Args:
+            titles (list of list of str) : Titles as lists of words.
+
+        Returns:
+            numpy.ndarray : (len(titles), len(EMOTIONS)) float matrix.
+        """
+        rows = []
+        owners = []
+        for i, title in enumerate(titles):
+            for word in title:
+                row = self.index.get(word.lower())
+                if row is not None:
+                    rows.append(row)
+                    owners.append(i)
+        sums = np.zeros((len(titles), len(self.EMOTIONS)))
+        if rows:
+            np.add.at(sums, np.array(owners), self.matrix[np.array(rows)])
+        return sums
@@ -1,6 +1,15 @@
+import atexit
+import multiprocessing
 import os
 import pickle
-from pattern.en import pluralize, singularize
+import sys
+import time
+
+try:
+    from resources.inflection import pluralize, singularize
+except ImportError:
+    sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+    from resources.inflection import pluralize, singularize
 
 import logging
 logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
@@ -21,21 +30,67 @@ try:
 except ImportError:
     from wordpicker import WordPicker, AttributeNotFound
 
+try:
+    from .titleset import normalise
+except ImportError:
+    from titleset import normalise
+
+# Evaluator of the worker processes, inherited from the parent on fork.
+_worker_evaluator = None
+
+
+def _evaluate_candidate(args):
+    """Evaluate a candidate title in a worker process."""
+    text, phenotype, emotion, threshold = args
+    return (phenotype,) + _worker_evaluator.cascade(text.split(" "), emotion, threshold)
+
+
 class tittlesTitle():
-    def __init__(self):
+    # Candidates per worker evaluated in one round trip to the pool, see _evaluate_in_pool.
+    CHUNK_PER_WORKER = 4
+
+    def __init__(self, batch_size=1, workers=1, guided=False):
+        """
+        Args:
+            batch_size (int) : Candidate titles generated per round.
+            workers (int) : Number of worker processes evaluating the rounds when batch_size is more than one,
+                            1 evaluates them in this process.
+            guided (bool) : Generate the titles behind the templates with a beam search
+                            towards the emotion instead of sampling them blindly.
+        """
         self.threshold = 0.825
         self.domain = 'word'
         self.folder = os.path.dirname(os.path.realpath(__file__))
+        self.batch_size = batch_size
+        self.workers = workers
         self.evaluator = Evaluator()
+
+        # The workers are forked once, now, before the template pool thread, the thesaurus threads and its
+        # sqlite connection exist. Forking a process with running threads can deadlock the child.
+        self.pool = None
+        if batch_size > 1 and workers > 1:
+            global _worker_evaluator
+            _worker_evaluator = self.evaluator
+            self.pool = multiprocessing.get_context('fork').Pool(workers)
+            atexit.register(self.close)
+
         self.wordpicker = WordPicker()
-        self.template_bank = TemplateBank(self.evaluator.title_bank)
+        self.template_bank = TemplateBank(self.evaluator.title_bank, self.evaluator.known_titles,
+                                          lexicon=self.evaluator.lexicon,
+                                          guide=self.evaluator if guided else None)
+        self.stats = {}
 
+    def close(self):
+        """Stop the worker processes."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
 
     def generate(self, *args, **kwargs):
         return self.create("", {}, number_of_artifacts=1)
 
-    def find_words(self, adjectives, activity, location, weather, slots):
-        return self.wordpicker.find_pairs(adjectives, activity, location, weather, slots)
+    def find_words(self, adjectives, activity, location, weather, slots, context=None):
+        return self.wordpicker.find_pairs(adjectives, activity, location, weather, slots, context)
 
     def evaluate(self, title):
         """
@@ -47,7 +102,7 @@ class tittlesTitle():
         Returns:
             Float [0, 1] : How good the title was - high being better.
         """
-        return self.evaluator.evaluate(title.split(" "), self.emotion)
+        return self.evaluator.evaluate(title.split(" "), self.emotion, self.threshold)
 
     def inject(self, title, word_pair):
         for (i, slot), word in zip(title.slots, word_pair):
@@ -59,6 +114,28 @@ class tittlesTitle():
             else:
                 title.inject(word, slot, i)
 
+    def candidate(self, adjectives, activity, location, weather, context=None):
+        """
+        Create a candidate title from a random template.
+
+        Returns:
+            Title : Title with its slots filled.
+
+        Raises:
+            AttributeNotFound : If no words could be found for the slots of the template.
+        """
+        template = self.template_bank.random_template(emotion=self.emotion)
+        title = Title(template)
+        word_pair = self.find_words(adjectives, activity, location, weather, title.slots, context)
+        self.inject(title, word_pair)
+        logger.debug('final title: ' + str(title))
+        return title
+
+    def accept(self, phenotype, v):
+        self.evaluator.add_title(phenotype)
+        self.template_bank.add_title(phenotype)
+        return (phenotype, {"evaluation": v})
+
     def create(self, emotion, word_pairs, number_of_artifacts=10, **kwargs):
         """Create artifacts in the group's domain.
 
@@ -89,24 +166,52 @@ class tittlesTitle():
         """
 
         self.emotion = emotion
+        self.template_bank.prepare(emotion)
 
-        ret = []
+        adjectives = (list(word_pair[1] for word_pair in word_pairs if word_pair[0] == 'animal'), list(word_pair[1] for word_pair in word_pairs if word_pair[0] == 'human'))
+        weather = dict(word_pairs)['weather']
+        activity = dict(word_pairs)['activity']
+        location = dict(word_pairs)['location']
+
+        # Resolve all thesaurus lookups up front, the loop below then runs without network waits.
+        context = self.wordpicker.prefetch(adjectives, activity, location, weather)
+        inputs = (adjectives, activity, location, weather, context)
+
+        self.stats = {'candidates': 0, 'evaluated': 0, 'accepted': 0}
+        self.evaluator.rejections.clear()
+        start = time.time()
+
+        if self.batch_size > 1:
+            ret = self._create_batched(inputs, number_of_artifacts)
+        else:
+            ret = self._create_serial(inputs, number_of_artifacts)
+
+        elapsed = time.time() - start
+        self.stats['seconds'] = elapsed
+        self.stats['candidates_per_second'] = self.stats['candidates'] / elapsed if elapsed > 0 else 0.
+        self.stats['acceptance_rate'] = self.stats['accepted'] / max(1, self.stats['candidates'])
+        logger.info('{candidates} candidates, {evaluated} evaluated, {accepted} accepted in {seconds:.2f}s '
+                    '({candidates_per_second:.1f} candidates/s, acceptance rate {acceptance_rate:.3f})'
+                    .format(**self.stats))
+        self.stats['rejections'] = dict(self.evaluator.rejections)
+        logger.info('rejections by stage: {}'.format(self.stats['rejections']))
 
+        # Comment out if you want to keep the original titles
+        self.evaluator.dump_titles()
+        self.template_bank.dump()
+        self.wordpicker.dump()
+        return ret
+
+    def _create_serial(self, inputs, number_of_artifacts):
+        """Create, evaluate and accept titles one at a time."""
+        ret = []
         subsequent_catches = 0
 
         while len(ret) != number_of_artifacts:
             logger.debug('generate new title')
 
-            adjectives = (list(word_pair[1] for word_pair in word_pairs if word_pair[0] == 'animal'), list(word_pair[1] for word_pair in word_pairs if word_pair[0] == 'human'))
-            weather = dict(word_pairs)['weather']
-            activity = dict(word_pairs)['activity']
-            location = dict(word_pairs)['location']
-
-            template = self.template_bank.random_template()
-            title = Title(template)
-
             try:
-                word_pair = self.find_words(adjectives, activity, location, weather, title.slots)
+                title = self.candidate(*inputs)
                 subsequent_catches = 0
             except AttributeNotFound:
                 subsequent_catches += 1
@@ -115,23 +220,81 @@ class tittlesTitle():
                     raise AttributeNotFound("Input attributes cannot be found from Thesaurus Rex.")
                 continue
 
-            self.inject(title, word_pair)
-            logger.debug('final title: ' + str(title))
-
+            self.stats['candidates'] += 1
+            self.stats['evaluated'] += 1
             v = self.evaluate(' '.join(title.tokens))
             if v >= self.threshold:
-                phenotype = str(title)
-                ret.append((phenotype, {"evaluation": v}))
-                self.evaluator.add_title(phenotype)
+                ret.append(self.accept(str(title), v))
+                self.stats['accepted'] += 1
             else:
                 logger.debug('evaluation below threshold')
 
-        # Comment out if you want to keep the original titles
-        self.evaluator.dump_titles()
         return ret
 
+    def _create_batched(self, inputs, number_of_artifacts):
+        """
+        Create titles in rounds of batch_size candidates.
+
+        Candidates failing the cheap filters are dropped right away, the rest
+        are evaluated in the worker processes, or in this process without
+        them. The workers got their evaluator when they were forked, so titles
+        accepted since then are only known to this process and duplicates of
+        them are rejected here.
+        """
+        ret = []
+        subsequent_catches = 0
+
+        while len(ret) < number_of_artifacts:
+            logger.debug('generate new batch of titles')
+
+            candidates = []
+            while len(candidates) < self.batch_size:
+                try:
+                    title = self.candidate(*inputs)
+                    subsequent_catches = 0
+                except AttributeNotFound:
+                    subsequent_catches += 1
+                    if subsequent_catches > 20:
+                        # Really unlikely case.
+                        raise AttributeNotFound("Input attributes cannot be found from Thesaurus Rex.")
+                    continue
+                candidates.append((' '.join(title.tokens), str(title), self.emotion, self.threshold))
+            self.stats['candidates'] += len(candidates)
+
+            survivors = [c for c in candidates if self.evaluator.prefilter(c[0].split(" "))]
+            self.evaluator.rejections['prefilter'] += len(candidates) - len(survivors)
+            self.stats['evaluated'] += len(survivors)
+
+            if self.pool is None:
+                results = ((phenotype,) + self.evaluator.cascade(text.split(" "), emotion, threshold)
+                           for text, phenotype, emotion, threshold in survivors)
+            else:
+                results = self._evaluate_in_pool(survivors)
+            for phenotype, v, stage in results:
+                if stage is not None:
+                    self.evaluator.rejections[stage] += 1
+                elif normalise(phenotype) in self.evaluator.known_titles:
+                    self.evaluator.rejections['novelty'] += 1
+                else:
+                    ret.append(self.accept(phenotype, v))
+                    self.stats['accepted'] += 1
+                    if len(ret) == number_of_artifacts:
+                        break
+
+        return ret
+
+    def _evaluate_in_pool(self, survivors):
+        """
+        Evaluate the candidates in the worker processes, CHUNK_PER_WORKER per worker at a time.
+
+        A chunk is submitted only once the results of the previous one have
+        been consumed, so stopping early leaves no work queued in the pool.
+        """
+        chunk = self.CHUNK_PER_WORKER * self.workers
+        for i in range(0, len(survivors), chunk):
+            yield from self.pool.map(_evaluate_candidate, survivors[i:i + chunk])
+
 if __name__ == "__main__":
-    import sys
     sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
     import inputs
     emotion, word_pairs = inputs.get_input(False)
@@ -1,48 +1,282 @@
+from array import array
+from bisect import bisect_right
 from collections import defaultdict
+from functools import partial
+import mmap
+import os
 import random
+import struct
+
+try:
+    from .titleset import normalise
+except ImportError:
+    from titleset import normalise
+
+START = '<START>'
+END = '<END>'
+
+# On-disk layout of a compiled chain: header, newline separated vocabulary and
+# the four int64 arrays, each starting at an 8 byte boundary. Bump the version
+# whenever the layout changes; older files are then simply retrained.
+MAGIC = b'TTMC'
+VERSION = 1
+HEADER = struct.Struct('<4sIIQQQQ')
+
 
 def windows(lst, n):
     for i in range(0, len(lst) - n + 1):
         yield tuple(lst[i:i+n])
 
+
+class CompiledChain:
+    """
+    Array-backed form of a trained MarkovChain.
+
+    Tokens are mapped to integer ids and the transitions are stored in CSR
+    layout: the outgoing edges of state s are edges[offsets[s]:offsets[s+1]].
+    For every edge we keep the target token id, the cumulative weight of the
+    edges of the same state up to and including it, and the index of the state
+    the chain moves to (-1 for edges into <END>). State 0 is the start state,
+    so sampling never has to hash token tuples.
+    """
+
+    def __init__(self, n, vocab, offsets, targets, cumweights, next_states, n_titles=0, buffer=None):
+        self.n = n
+        self.vocab = vocab
+        self.offsets = offsets
+        self.targets = targets
+        self.cumweights = cumweights
+        self.next_states = next_states
+        self.n_titles = n_titles
+        # Mapped file of a loaded chain, None for one compiled in memory.
+        self._buffer = buffer
+
+    @classmethod
+    def from_transitions(cls, n, transition, n_titles=0):
+        vocab = [START, END]
+        token_ids = {START: 0, END: 1}
+        start = (START,) * n
+
+        # Start state first, the rest in insertion order.
+        states = [start] + [s for s in transition if s != start]
+        state_ids = {s: i for i, s in enumerate(states)}
+
+        offsets = array('q', [0])
+        targets = array('q')
+        cumweights = array('q')
+        next_states = array('q')
+
+        for state in states:
+            total = 0
+            for token, count in transition.get(state, {}).items():
+                if token not in token_ids:
+                    token_ids[token] = len(vocab)
+                    vocab.append(token)
+                total += count
+                targets.append(token_ids[token])
+                cumweights.append(total)
+                next_states.append(-1 if token == END else state_ids[state[1:] + (token,)])
+            offsets.append(len(targets))
+
+        return cls(n, vocab, offsets, targets, cumweights, next_states, n_titles)
+
+    def save(self, path):
+        """
+        Write the chain to path in the versioned binary format.
+
+        The file is written next to the target and moved in place, so a chain
+        that is currently mapped from the same path stays valid.
+        """
+        vocab = '\n'.join(self.vocab).encode('utf-8')
+        arrays = (self.offsets, self.targets, self.cumweights, self.next_states)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.n, self.n_titles, len(vocab),
+                                len(self.offsets), len(self.targets)))
+            f.write(vocab)
+            for values in arrays:
+                f.write(b'\0' * (-f.tell() % 8))
+                f.write(array('q', values).tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map a chain saved with save() into memory.
+
+        Returns:
+            CompiledChain : Chain whose arrays are views into the mapped file.
+
+        Raises:
+            ValueError : If the file is not a chain of the current format version.
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, n, n_titles, vocab_size, n_offsets, n_edges = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            buffer.close()
+            raise ValueError(f'{path} is not a version {VERSION} Markov chain')
+
+        position = HEADER.size
+        vocab = bytes(buffer[position:position + vocab_size]).decode('utf-8').split('\n')
+        position += vocab_size
+
+        view = memoryview(buffer)
+        arrays = []
+        for length in (n_offsets, n_edges, n_edges, n_edges):
+            position += -position % 8
+            arrays.append(view[position:position + 8 * length].cast('q'))
+            position += 8 * length
+
+        return cls(n, vocab, *arrays, n_titles=n_titles, buffer=buffer)
+
+    def to_transitions(self):
+        """Rebuild the nested token counts the chain was compiled from."""
+        transition = defaultdict(partial(defaultdict, int))
+        # States are numbered in the order training first reached them, so
+        # each one is the successor of a lower-numbered state and gets its
+        # name before its own edges are walked.
+        names = {0: (START,) * self.n}
+        for s in range(len(self.offsets) - 1):
+            state = names[s]
+            previous = 0
+            for e in range(self.offsets[s], self.offsets[s + 1]):
+                token = self.vocab[self.targets[e]]
+                transition[state][token] = self.cumweights[e] - previous
+                previous = self.cumweights[e]
+                if self.next_states[e] >= 0:
+                    names.setdefault(self.next_states[e], state[1:] + (token,))
+        return transition
+
+    def sample_edge(self, state, rng=random):
+        """Pick an outgoing edge of state with probability proportional to its weight."""
+        lo, hi = self.offsets[state], self.offsets[state + 1]
+        # Cumulative weights restart from zero for every state, so a
+        # binary search over the state's own slice picks the edge.
+        r = rng.randrange(self.cumweights[hi - 1])
+        return bisect_right(self.cumweights, r, lo, hi)
+
+    def sample(self, rng=random):
+        """Generate a single token sequence by walking the chain from the start state."""
+        offsets, targets, next_states = self.offsets, self.targets, self.next_states
+        output = []
+        state = 0
+        while True:
+            if offsets[state] == offsets[state + 1]:
+                break
+            e = self.sample_edge(state, rng)
+            state = next_states[e]
+            if state < 0:
+                break
+            output.append(self.vocab[targets[e]])
+        return ' '.join(output)
+
+
 class MarkovChain:
-    def __init__(self, n):
+    def __init__(self, n, corpus=None):
         self.n = n
-        self.transition = defaultdict(lambda: defaultdict(int))
-        self.corpus = set()
+        self.transition = defaultdict(partial(defaultdict, int))
+        # Training titles, generated sequences found here are rejected. Any
+        # container with add() works, e.g. a TitleSet shared with the Evaluator.
+        self.corpus = set() if corpus is None else corpus
+        self.n_titles = 0
+        self._compiled = None
+
+    @classmethod
+    def load(cls, path, corpus=None):
+        """
+        Load a chain trained and saved earlier.
+
+        Only the compiled arrays are read, the token counts are rebuilt the
+        first time a new title is added. The corpus of training titles is not
+        stored with the chain, pass it in or it starts out empty.
+        """
+        compiled = CompiledChain.load(path)
+        markov = cls(compiled.n, corpus)
+        markov.transition = None
+        markov.n_titles = compiled.n_titles
+        markov._compiled = compiled
+        return markov
+
+    def save(self, path):
+        self.compiled.save(path)
 
     def add(self, string):
+        if self.transition is None:
+            self.transition = self._compiled.to_transitions()
         tokens = string.split()
-        for w in windows(['<START>'] * self.n + tokens + ['<END>'], self.n + 1):
+        for w in windows([START] * self.n + tokens + [END], self.n + 1):
             self.transition[w[:-1]][w[-1]] += 1
         self.corpus.add(' '.join(tokens))
+        self.n_titles += 1
+        self._compiled = None
+
+    @property
+    def compiled(self):
+        """Compiled form of the chain, rebuilt lazily after new titles are added."""
+        if self._compiled is None:
+            self._compiled = CompiledChain.from_transitions(self.n, self.transition, self.n_titles)
+        return self._compiled
+
+    def generate(self, max_attempts=100):
+        """
+        Generate a sequence that is not a verbatim copy of a training title.
+
+        Args:
+            max_attempts (int) : How many samples to draw before giving up.
+
+        Returns:
+            str or None : Generated sequence, None if every attempt reproduced the corpus.
+        """
+        compiled = self.compiled
+        for _ in range(max_attempts):
+            output = compiled.sample()
+            if output not in self.corpus:
+                return output
+        return None
+
+    def generate_many(self, n, max_attempts=100):
+        """Generate n novel sequences, skipping the ones that run out of attempts."""
+        outputs = []
+        for _ in range(n):
+            output = self.generate(max_attempts)
+            if output is not None:
+                outputs.append(output)
+        return outputs
+
+
+def train(title_bank, n=3, corpus=None):
+    """Train a chain of order n over the titles of a title bank."""
+    markov = MarkovChain(n, corpus)
+    for item in title_bank.values():
+        markov.add(normalise(item['title']))
+    return markov
 
-    def generate(self):
-        output = []
-        state = ('<START>',) * self.n
-        while True:
-            next_state = random.choices(list(self.transition[state].keys()),
-                                        list(self.transition[state].values()))[0]
-            if next_state == '<END>':
-                break
-            output.append(next_state)
-            state = state[1:] + (next_state,)
-        output = ' '.join(output)
-        if output in self.corpus:
-            return self.generate()
-        return output
 
 if __name__ == "__main__":
-    import os
+    import argparse
     import pickle
     folder = os.path.dirname(os.path.realpath(__file__))
-    markov = MarkovChain(3)
-    with open(os.path.join(folder, "data", "titles.pickle"), "rb") as f:
-        title_bank = pickle.load(f)
-    for item in title_bank.values():
-        markov.add(item['title'])
-    # with open(os.path.join(folder, "data", "templates.short.uniq"), "r") as f:
-    #     title_bank = [l.strip() for l in f.readlines()]
-    # for title in title_bank:
-    #     markov.add(title)
+
+    parser = argparse.ArgumentParser(description='Train the title Markov chain.')
+    parser.add_argument('--titles', default=os.path.join(folder, "data", "titles.pickle"),
+                        help='Pickled title bank to train from.')
+    parser.add_argument('--output', default=os.path.join(folder, "data", "markov.bin"),
+                        help='Where to write the compiled chain.')
+    parser.add_argument('--order', type=int, default=3, help='Order of the chain.')
+    parser.add_argument('--add', nargs='*', default=[],
+                        help='Add titles to an existing chain instead of retraining.')
+    args = parser.parse_args()
+
+    if args.add:
+        markov = MarkovChain.load(args.output)
+        for title in args.add:
+            markov.add(normalise(title))
+    else:
+        with open(args.titles, "rb") as f:
+            title_bank = pickle.load(f)
+        markov = train(title_bank, args.order)
+    markov.save(args.output)
+    print(f'{markov.n_titles} titles, {len(markov.compiled.vocab)} tokens, '
+          f'{len(markov.compiled.targets)} transitions')
     print(markov.generate())
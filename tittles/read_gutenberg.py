@@ -1,10 +1,15 @@
 # FROM Github gist https://gist.github.com/srazi/a0ae552cd8376e931df3a2098138f2d8
+import io
 import os
 import re
 import gzip
 import tarfile
+import threading
 import urllib
 import xml.etree.cElementTree as ElementTree
+from collections import deque
+from multiprocessing import Pool
+from queue import Queue
 try:
     import cPickle as pickle
 except ImportError:
@@ -20,6 +25,16 @@ NS = dict(
         dc='http://purl.org/dc/terms/',
         dcam='http://purl.org/dc/dcam/',
         rdf='http://www.w3.org/1999/02/22-rdf-syntax-ns#')
+EBOOK = '{%(pg)s}ebook' % NS
+ABOUT = '{%(rdf)s}about' % NS
+TITLE = '{%(dc)s}title' % NS
+SUBJECT = '{%(dc)s}subject' % NS
+MEMBEROF = '{%(dcam)s}memberOf' % NS
+RESOURCE = '{%(rdf)s}resource' % NS
+LANGUAGE = '{%(dc)s}language' % NS
+TYPE = '{%(dc)s}type' % NS
+VALUE = '{%(rdf)s}value' % NS
+LCSH = '%(dc)sLCSH' % NS
 LINEBREAKRE = re.compile(r'[ \t]*[\n\r]+[ \t]*')
 ETEXTRE = re.compile(r'''
     e(text|b?ook)
@@ -65,6 +80,122 @@ def readmetadata():
     return metadata
 
 
+def streammetadata(path=RDFFILES, processes=None, batch_size=256):
+    """Stream the fields needed for the title bank from the Gutenberg catalog.
+
+    The archive is decompressed in a thread of its own, and its members are
+    parsed with parserdf in batches across a process pool. Only a bounded
+    number of batches is in flight at any time, so memory use does not grow
+    with the size of the catalog.
+    Args:
+        path (str): The catalog, downloaded first if it does not exist.
+        processes (int): Number of parser processes, defaults to the number of CPUs.
+        batch_size (int): Number of RDF files parsed per task.
+    Yields:
+        dict: The META_FIELDS of an ebook.
+    """
+    if not os.path.exists(path):
+        import urllib.request
+        _, _ = urllib.request.urlretrieve(RDFURL, path)
+
+    processes = processes or os.cpu_count()
+    batches = Queue(maxsize=2 * processes)
+    reader = threading.Thread(target=_readbatches, args=(path, batches, batch_size), daemon=True)
+
+    # The pool forks its workers, so it is created before the reader thread
+    # is started: forking a process with running threads can deadlock.
+    with Pool(processes) as pool:
+        reader.start()
+        pending = deque()
+        done = False
+        while not done or pending:
+            while not done and len(pending) < 2 * processes:
+                batch = batches.get()
+                if batch is None:
+                    done = True
+                elif isinstance(batch, BaseException):
+                    raise batch
+                else:
+                    pending.append(pool.apply_async(_parsebatch, (batch,)))
+            if pending:
+                yield from pending.popleft().get()
+    reader.join()
+
+
+def _readbatches(path, batches, batch_size):
+    """Put the raw RDF files of the catalog on the queue in batches, then None."""
+    try:
+        # Stream mode, the members are read in archive order without seeking.
+        with tarfile.open(path, 'r|bz2') as archive:
+            batch = []
+            for tarinfo in archive:
+                if not tarinfo.isfile():
+                    continue
+                batch.append(archive.extractfile(tarinfo).read())
+                if len(batch) == batch_size:
+                    batches.put(batch)
+                    batch = []
+            if batch:
+                batches.put(batch)
+        batches.put(None)
+    except BaseException as e:
+        batches.put(e)
+
+
+def _parsebatch(batch):
+    return [result for result in map(parserdf, batch) if result is not None]
+
+
+def parserdf(data):
+    """Extracts the META_FIELDS of an ebook from a raw RDF file.
+    Uses iterparse to pick the fields while reading instead of building and
+    querying the whole tree.
+    Args:
+        data (bytes): The RDF file.
+    Returns:
+        dict: The fields, or None if the file does not define an ebook.
+    """
+    result = dict.fromkeys(META_FIELDS)
+    result['subjects'] = set()
+    languages = []
+    context = []
+    subject = None
+    for event, elem in ElementTree.iterparse(io.BytesIO(data), events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            context.append(tag)
+            if tag == EBOOK:
+                result['id'] = int(os.path.basename(elem.get(ABOUT)))
+            elif tag == SUBJECT:
+                subject = [None, None]
+            continue
+
+        context.pop()
+        if tag == TITLE:
+            if result['title'] is None and elem.text is not None:
+                result['title'] = fixsubtitles(safeunicode(elem.text, encoding='utf-8'))
+        elif tag == MEMBEROF:
+            if subject is not None:
+                subject[0] = elem.get(RESOURCE)
+        elif tag == VALUE:
+            if SUBJECT in context:
+                subject[1] = elem.text
+            elif LANGUAGE in context:
+                languages.append(elem.text)
+            elif TYPE in context and result['type'] is None:
+                result['type'] = elem.text
+        elif tag == SUBJECT:
+            if subject[0] == LCSH:
+                result['subjects'].add(subject[1])
+            subject = None
+        elem.clear()
+
+    if result['id'] is None:
+        return None
+    result['language'] = languages or None
+    return result
+
+
 def getrdfdata():
     """Downloads Project Gutenberg RDF catalog.
     Yields:
@@ -0,0 +1,135 @@
+import os
+import pickle
+from nltk.corpus import wordnet as wn
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class RelationCache:
+    """
+    WordNet relations of words, computed once per word.
+
+    Words are interned to integer ids and every word keeps the sets of ids
+    of its synonyms, related words (hypernyms and hyponyms), antonyms and
+    antonym related words, plus the name of its first synset. Scoring a
+    pair of known words is then a few set lookups, path similarities are
+    memoised by synset pair.
+    """
+
+    VERSION = 1
+    PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data", "wordnet_relations.pickle")
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.relations = {}
+        self.similarities = {}
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path=None):
+        """Load a cache saved earlier, or create an empty one if there is none."""
+        cache = cls()
+        try:
+            with open(path or cls.PATH, "rb") as f:
+                version, cache.names, cache.relations, cache.similarities = pickle.load(f)
+        except FileNotFoundError:
+            return cache
+        if version != cls.VERSION:
+            logger.info('discarding WordNet relation cache of version {}'.format(version))
+            return cls()
+        cache.ids = {name: i for i, name in enumerate(cache.names)}
+        return cache
+
+    def save(self, path=None):
+        """Save the cache if new words were added since it was loaded."""
+        if not self._dirty:
+            return
+        with open(path or self.PATH, "wb") as f:
+            pickle.dump((self.VERSION, self.names, self.relations, self.similarities), f)
+        self._dirty = False
+
+    def _id(self, word):
+        if word not in self.ids:
+            self.ids[word] = len(self.names)
+            self.names.append(word)
+        return self.ids[word]
+
+    def _relations(self, word):
+        """Relation sets of word as (synonyms, related, antonyms, antonym related, first synset)."""
+        word_id = self._id(word)
+        if word_id in self.relations:
+            return self.relations[word_id]
+
+        synonyms = set()
+        related = set()
+        opposites = set()
+        antonym_related = set()
+        synsets = wn.synsets(word)
+        for synset in synsets:
+            synonyms.update(synset.lemma_names())
+            for hypernym in synset.hypernyms():
+                related.add(hypernym.lemmas()[0].name())
+            for hyponym in synset.hyponyms():
+                related.add(hyponym.lemmas()[0].name())
+            for lemma in synset.lemmas():
+                for antonym in lemma.antonyms():
+                    opposites.add(antonym.name())
+                    for hypernym in antonym.hypernyms():
+                        antonym_related.add(hypernym.name())
+                    for hyponym in antonym.hyponyms():
+                        antonym_related.add(hyponym.name())
+
+        entry = tuple(frozenset(self._id(w) for w in words)
+                      for words in (synonyms, related, opposites, antonym_related))
+        entry += (synsets[0].name() if synsets else None,)
+        self.relations[word_id] = entry
+        self._dirty = True
+        return entry
+
+    def _similarity(self, synset1, synset2):
+        key = (synset1, synset2)
+        if key not in self.similarities:
+            similarity = wn.path_similarity(wn.synset(synset1), wn.synset(synset2))
+            self.similarities[key] = 0 if similarity is None else similarity
+            self._dirty = True
+        return self.similarities[key]
+
+    def score(self, word1, word2):
+        """
+        Gets measure of how far words are from each other semantically, using WordNet
+        Score of -1 means words are synonyms, -0.5 that they are related (hyper- or hyponyms)
+        Score of 0.5 means words are semi-antonyms (hyper- or hyponym of antonym), 1 that they are antonyms
+        If words are none of these things, wordnet path similarity is used
+        Default score: 0
+        """
+        if word1 == word2:
+            return 0
+        synonyms, related, opposites, antonym_related, synset1 = self._relations(word1)
+        word2_id = self._id(word2)
+        if word2_id in synonyms:
+            return -1
+        if word2_id in opposites:
+            return 1
+        if word2_id in related:
+            return -0.5
+        if word2_id in antonym_related:
+            return 0.5
+        synset2 = self._relations(word2)[4]
+        if synset1 is None or synset2 is None:
+            return 0
+        return self._similarity(synset1, synset2)
+
+    def score_pairs(self, pairs):
+        """Score a batch of (word1, word2) pairs, see score."""
+        return [self.score(word1, word2) for word1, word2 in pairs]
+
+
+if __name__ == "__main__":
+    # Precompute the relations of every WordNet lemma.
+    cache = RelationCache.load()
+    for name in wn.all_lemma_names():
+        cache._relations(name)
+    cache.save()
+    print(f'{len(cache.relations)} words, {len(cache.names)} interned names')
@@ -0,0 +1,148 @@
+from array import array
+import os
+import pickle
+import re
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+def subject_terms(subject):
+    """Terms of an LCSH subject, e.g. 'England -- Social life and customs -- Fiction'."""
+    return [term.strip().lower() for term in subject.split('--') if term.strip()]
+
+
+class SubjectIndex:
+    """
+    Inverted indices from subject terms and emotions to title ids.
+
+    The emotion of a title is scored with the sentiment lexicon over the
+    words of its title and of its subjects, so that e.g. a book on
+    'Horror tales' counts towards fear even when its title does not.
+    A title is indexed under the emotion with the highest score, if any.
+    Subject terms are scored the same way on their own, and the titles of a
+    term conveying an emotion count towards that emotion as well.
+
+    Titles are kept by their position in the bank (ordinal) in the indices,
+    so that the titles of an emotion are listed in the order of the bank and
+    titles added later come last.
+    """
+
+    VERSION = 3
+    PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data", "subjects.pickle")
+    EMOTIONS = ['anger', 'disgust', 'fear', 'happiness', 'sadness', 'surprise']
+
+    def __init__(self, ids=None, subjects=None, term_emotions=None, emotions=None):
+        """
+        Args:
+            ids (array) : Id of every indexed title, by ordinal.
+            subjects (dict) : Ordinals of the titles having each subject term.
+            term_emotions (dict) : Emotion conveyed by each subject term, None if it conveys none.
+            emotions (dict) : Ordinals of the titles conveying each emotion most.
+        """
+        self.ids = array('q') if ids is None else ids
+        self.subjects = {} if subjects is None else subjects
+        self.term_emotions = {} if term_emotions is None else term_emotions
+        self.emotions = emotions or {emotion: array('I') for emotion in self.EMOTIONS}
+
+    @property
+    def n_titles(self):
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, title_bank, lexicon):
+        """
+        Args:
+            title_bank (dict) : Known titles, values are dictionaries with a 'title' and optionally a 'subjects' key.
+            lexicon (SentimentLexicon) : Lexicon to score the emotions with.
+        """
+        index = cls()
+        index.add(title_bank.items(), lexicon)
+        return index
+
+    def _emotions_of(self, texts, lexicon):
+        """Emotion with the highest lexicon score of each text, None for texts without one."""
+        if not texts:
+            return []
+        scores = lexicon.sums([WORD.findall(text) for text in texts])
+        best = scores.argmax(axis=1)
+        found = [None] * len(texts)
+        for i in np.flatnonzero(scores.max(axis=1) > 0):
+            found[i] = self.EMOTIONS[best[i]]
+        return found
+
+    def add(self, items, lexicon):
+        """
+        Index more titles of the bank.
+
+        Args:
+            items (iterable of tuple) : (id, title dictionary) pairs, in the order of the bank.
+            lexicon (SentimentLexicon) : Lexicon to score the emotions with.
+
+        Returns:
+            list of set : Emotions each title counts towards, see emotion_titles.
+        """
+        texts = []
+        title_terms = []
+        for tid, info in items:
+            subjects = list(info.get('subjects') or ())
+            texts.append(' '.join([info['title']] + subjects).lower())
+            title_terms.append({term for subject in subjects for term in subject_terms(subject)})
+            self.ids.append(tid)
+
+        new_terms = sorted({term for terms in title_terms for term in terms} - self.term_emotions.keys())
+        self.term_emotions.update(zip(new_terms, self._emotions_of(new_terms, lexicon)))
+
+        found = []
+        first = self.n_titles - len(texts)
+        for ordinal, terms, emotion in zip(range(first, self.n_titles), title_terms,
+                                           self._emotions_of(texts, lexicon)):
+            if emotion is not None:
+                self.emotions[emotion].append(ordinal)
+            for term in terms:
+                self.subjects.setdefault(term, array('I')).append(ordinal)
+            found.append(({emotion} | {self.term_emotions[term] for term in terms}) - {None})
+        return found
+
+    def save(self, path=None):
+        with open(path or self.PATH, "wb") as f:
+            pickle.dump((self.VERSION, self.ids, self.subjects, self.term_emotions, self.emotions), f)
+
+    @classmethod
+    def load(cls, title_bank, lexicon, path=None):
+        """
+        Load the index saved at path, building and saving it first if it is missing or outdated.
+
+        Titles added to the bank since the index was saved are the last ones
+        of the bank, only those are indexed.
+        """
+        index = None
+        try:
+            with open(path or cls.PATH, "rb") as f:
+                version, *state = pickle.load(f)
+            if version == cls.VERSION and len(state[0]) <= len(title_bank):
+                index = cls(*state)
+        except (FileNotFoundError, ValueError, TypeError):
+            pass
+
+        if index is None:
+            logger.info('indexing subjects of {} titles'.format(len(title_bank)))
+            index = cls.build(title_bank, lexicon)
+        elif index.n_titles < len(title_bank):
+            index.add(list(title_bank.items())[index.n_titles:], lexicon)
+        else:
+            return index
+        index.save(path)
+        return index
+
+    def emotion_titles(self, emotion):
+        """
+        Ids of the titles that convey the emotion most, or have a subject term conveying it, in the order of the bank.
+        """
+        ordinals = [self.emotions.get(emotion, array('I'))]
+        ordinals += [self.subjects[term] for term, conveyed in self.term_emotions.items() if conveyed == emotion]
+        merged = np.unique(np.concatenate([np.asarray(o, dtype=np.int64) for o in ordinals]))
+        return array('q', (self.ids[i] for i in merged))
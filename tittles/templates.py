@@ -1,10 +1,22 @@
+from collections import deque
+import itertools
+import json
+import os
 import random
+import threading
+import time
 import spacy
 
 try:
-    from .markov import MarkovChain
+    from .beam import BeamSearch
+    from .markov import MarkovChain, train
+    from .subjects import SubjectIndex
+    from .titleset import TitleSet, normalise
 except ImportError:
-    from markov import MarkovChain
+    from beam import BeamSearch
+    from markov import MarkovChain, train
+    from subjects import SubjectIndex
+    from titleset import TitleSet, normalise
 
 import logging
 logger = logging.getLogger(__name__)
@@ -49,60 +61,338 @@ class Title:
         return "".join(self._tokens)
 
 
-class TemplateBank:
-    def __init__(self, title_bank):
-        self.markov = MarkovChain(3)
-        for item in title_bank.values():
-            self.markov.add(item['title'].replace('—', '-'))
-
-    def _random_template(self):
-        title = self.markov.generate()
-
-        replacements = {}
-        tokens = []
-        doc = nlp(title)
-
-        i = 0
-        for token in doc:
-            # Consider named entities as single token.
-            if token.ent_type_ in ('PERSON', 'FAC', 'GPE', 'LOC'):
-                if token.ent_iob == 1:
-                    tokens[-2] += tokens[-1] + token.text
-                    tokens[-1] = token.whitespace_
-                else:
-                    tokens.append(token.text)
-                    tokens.append(token.whitespace_)
-                    replacements[i] = '[[PERSON]]' if token.ent_type_ == 'PERSON' else '[[LOC]]'
-                    i += 2
-                continue
+def make_template(doc, choose=None):
+    """
+    Create a template from a tagged title by replacing two random taggable tokens with slots.
+
+    Args:
+        doc (spacy.tokens.Doc) : Tagged title.
+        choose (callable) : Picks the template from the templates of every pair of taggable tokens instead, e.g.
+            BeamSearch.choose_template.
 
-            tokens.append(token.text)
-            tokens.append(token.whitespace_)
-            if token.tag_ in ("NN", "NNP"):
-                replacements[i] = "[[NOUN]]"
-            elif token.tag_ in ("NNS", "NNPS"):
-                replacements[i] = "[[NOUNS]]"
-            elif token.pos_ == "ADJ":
-                replacements[i] = "[[ADJ]]"
-            i += 2
+    Returns:
+        list of str : Tokens interleaved with their whitespace, None if the title has less than two slots.
+    """
+    replacements = {}
+    tokens = []
 
-        if len(replacements) < 2:
-            return None
+    i = 0
+    for token in doc:
+        # Consider named entities as single token.
+        if token.ent_type_ in ('PERSON', 'FAC', 'GPE', 'LOC'):
+            if token.ent_iob == 1:
+                tokens[-2] += tokens[-1] + token.text
+                tokens[-1] = token.whitespace_
+            else:
+                tokens.append(token.text)
+                tokens.append(token.whitespace_)
+                replacements[i] = '[[PERSON]]' if token.ent_type_ == 'PERSON' else '[[LOC]]'
+                i += 2
+            continue
 
-        logger.debug('generated title: ' + ''.join(tokens))
+        tokens.append(token.text)
+        tokens.append(token.whitespace_)
+        if token.tag_ in ("NN", "NNP"):
+            replacements[i] = "[[NOUN]]"
+        elif token.tag_ in ("NNS", "NNPS"):
+            replacements[i] = "[[NOUNS]]"
+        elif token.pos_ == "ADJ":
+            replacements[i] = "[[ADJ]]"
+        i += 2
 
-        # Create a template by replacing two random tokens with POS tags
-        for i, replacement in random.sample(replacements.items(), 2):
+    if len(replacements) < 2:
+        return None
+
+    logger.debug('generated title: ' + ''.join(tokens))
+
+    # Create a template by replacing two tokens with POS tags, random ones unless chosen
+    if choose is None:
+        for i, replacement in random.sample(list(replacements.items()), 2):
             tokens[i] = replacement
+    else:
+        templates = []
+        for pair in itertools.combinations(replacements.items(), 2):
+            template = list(tokens)
+            for i, replacement in pair:
+                template[i] = replacement
+            templates.append(template)
+        tokens = choose(templates)
+
+    logger.debug('generated template: ' + ''.join(tokens))
+
+    return tokens
+
+
+class TemplatePool:
+    """
+    Pool of ready templates, refilled in batches by a background worker.
+
+    Markov titles are generated in bulk and tagged with nlp.pipe, which is
+    much cheaper per title than tagging them one by one. Templates are
+    bucketed by their slot types, e.g. ('ADJ', 'NOUN').
+    """
+
+    # The dependency parser is not needed for tags or entities.
+    DISABLE = ('parser',)
+    # Seconds the worker waits after a batch without templates, doubled up to MAX_BACKOFF while they stay empty.
+    BACKOFF = 0.1
+    MAX_BACKOFF = 10
+
+    def __init__(self, markov, lock, size=200, batch_size=64, path=None, generator=None):
+        """
+        Args:
+            markov (MarkovChain) : Chain to generate the titles with.
+            lock (threading.Lock) : Lock guarding the chain against concurrent updates.
+            size (int) : Number of templates the worker keeps ready.
+            batch_size (int) : Number of titles generated and tagged at once.
+            path (str) : File the pool is persisted to between runs, not persisted if None.
+            generator (BeamSearch) : Generates the titles over the chain instead of plain sampling.
+        """
+        self.markov = markov
+        self.generator = generator or markov
+        self.lock = lock
+        self.size = size
+        self.batch_size = batch_size
+        self.path = path
+        self.buckets = {}
+        self._count = 0
+        self._ready = threading.Condition()
+        self._worker = None
+        # Exception the worker stopped on, raised from pop.
+        self._error = None
+
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self._extend(json.load(f))
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def slot_types(template):
+        return tuple(tok[2:-2] for tok in template if tok.startswith('[[') and tok.endswith(']]'))
+
+    def _extend(self, templates):
+        with self._ready:
+            for template in templates:
+                self.buckets.setdefault(self.slot_types(template), deque()).append(template)
+                self._count += 1
+            self._ready.notify_all()
+
+    def refill(self):
+        """
+        Generate and tag one batch of titles, and add the resulting templates to the pool.
+
+        Returns:
+            int : Number of templates added.
+        """
+        with self.lock:
+            titles = self.generator.generate_many(self.batch_size)
+        choose = getattr(self.generator, 'choose_template', None)
+        templates = [make_template(doc, choose)
+                     for doc in nlp.pipe(titles, batch_size=self.batch_size, disable=self.DISABLE)]
+        templates = [t for t in templates if t is not None]
+        self._extend(templates)
+        return len(templates)
+
+    def _work(self):
+        backoff = self.BACKOFF
+        while True:
+            with self._ready:
+                while self._count >= self.size:
+                    self._ready.wait()
+            try:
+                added = self.refill()
+            except Exception as e:
+                logger.exception('template worker failed')
+                with self._ready:
+                    self._error = e
+                    self._ready.notify_all()
+                return
+            if added:
+                backoff = self.BACKOFF
+            else:
+                time.sleep(backoff)
+                backoff = min(2 * backoff, self.MAX_BACKOFF)
+
+    def start(self):
+        """Start refilling the pool in a background thread."""
+        if self._worker is None or not self._worker.is_alive():
+            self._error = None
+            self._worker = threading.Thread(target=self._work, name='template-pool', daemon=True)
+            self._worker.start()
+
+    def pop(self, slots=None, timeout=60):
+        """
+        Take a template from the pool, waiting for the worker if the pool is empty.
+
+        Args:
+            slots (tuple of str) : Slot types the template must have, any if None.
+            timeout (float) : Seconds to wait for a fitting template.
+
+        Raises:
+            RecursionError : If no fitting template became available in time.
+            Exception : The exception the worker stopped on, if it failed before a fitting template was available.
+                The worker is restarted for the next call.
+        """
+        def available():
+            if slots is not None:
+                return len(self.buckets.get(slots, ()))
+            return self._count
+
+        with self._ready:
+            if not self._ready.wait_for(lambda: available() or self._error is not None, timeout):
+                raise RecursionError("Title generation was unable to find fitting template.")
+            if not available():
+                error = self._error
+                # The worker returns right after storing the error.
+                self._worker.join()
+                self.start()
+                raise error
+            if slots is None:
+                # Pick a bucket with probability proportional to its size.
+                keys = [k for k, v in self.buckets.items() if v]
+                slots = random.choices(keys, [len(self.buckets[k]) for k in keys])[0]
+            template = self.buckets[slots].popleft()
+            self._count -= 1
+            self._ready.notify_all()
+        return template
+
+    def dump(self):
+        """Save the templates currently in the pool."""
+        if self.path is None:
+            return
+        with self._ready:
+            templates = [t for bucket in self.buckets.values() for t in bucket]
+        with open(self.path, 'w') as f:
+            json.dump(templates, f)
+
+
+def load_or_train(path, title_bank, known_titles):
+    """
+    Load the chain saved at path, or train and save it if it is missing or was trained on more titles.
+
+    Titles added to the bank since the chain was saved are the last ones of
+    the bank, the chain is trained with only those.
+    """
+    markov = None
+    try:
+        markov = MarkovChain.load(path, known_titles)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    if markov is None or markov.n_titles > len(title_bank):
+        logger.info('training Markov chain over {} titles'.format(len(title_bank)))
+        markov = train(title_bank, 3, known_titles)
+    elif markov.n_titles < len(title_bank):
+        for item in list(title_bank.values())[markov.n_titles:]:
+            markov.add(normalise(item['title']))
+    else:
+        return markov
+    markov.save(path)
+    return markov
+
+
+class TemplateBank:
+    MARKOV_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data", "markov.bin")
+    POOL_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data", "templates.json")
+    # Emotions with fewer titles than this sample from the chain over all titles.
+    MIN_EMOTION_TITLES = 500
+
+    def __init__(self, title_bank, known_titles=None, pool_size=200, persist_pool=True, lexicon=None, guide=None):
+        """
+        Args:
+            title_bank (dict) : Known titles, values are dictionaries with a 'title' key.
+            known_titles (TitleSet) : Normalised titles of the bank, e.g. the Evaluator's, built if not given.
+            pool_size (int) : Number of templates kept ready by the background worker.
+            persist_pool (bool) : Keep the unused templates on disk between runs.
+            lexicon (SentimentLexicon) : Lexicon for emotion conditioned sampling, see prepare.
+            guide (Evaluator) : Generate titles for prepared emotions with a beam search scored by the evaluator.
+        """
+        if known_titles is None:
+            known_titles = TitleSet(normalise(item['title']) for item in title_bank.values())
+
+        self.title_bank = title_bank
+        self.known_titles = known_titles
+        self.pool_size = pool_size
+        self.guide = guide
+        self.lock = threading.Lock()
+        # Accepted titles are trained into the chain on dump, so that the
+        # chain is not recompiled after every accepted title.
+        self._pending = []
+
+        # Reuse the chain trained on an earlier run as long as it was trained
+        # on the same titles, see `python markov.py` for training it offline.
+        self.markov = load_or_train(self.MARKOV_PATH, title_bank, known_titles)
+
+        self.lexicon = lexicon
+        self.subjects = None if lexicon is None else SubjectIndex.load(title_bank, lexicon)
+        # Chains over the titles conveying an emotion, by prepared emotion.
+        self.chains = {}
+
+        self.pool = TemplatePool(self.markov, self.lock, size=pool_size,
+                                 path=self.POOL_PATH if persist_pool else None)
+        self.pool.start()
+        # Template pools by emotion, None for the pool over all titles.
+        self.pools = {None: self.pool}
+
+    def prepare(self, emotion):
+        """
+        Start sampling templates for the emotion from a chain trained only on the titles conveying it.
+
+        Falls back to the chain over all titles without a subject index or with too few such titles.
+        With a guide, the titles are generated with a beam search towards the emotion.
+        """
+        if emotion in self.pools:
+            return
+        ids = () if self.subjects is None else self.subjects.emotion_titles(emotion)
+        if len(ids) >= self.MIN_EMOTION_TITLES:
+            markov = load_or_train(self.emotion_path(emotion), {tid: self.title_bank[tid] for tid in ids},
+                                   self.known_titles)
+            self.chains[emotion] = markov
+        elif self.guide is not None:
+            markov = self.markov
+        else:
+            self.pools[emotion] = self.pool
+            return
+
+        generator = None if self.guide is None else BeamSearch(markov, self.guide, emotion)
+        self.pools[emotion] = TemplatePool(markov, self.lock, size=self.pool_size, generator=generator)
+        self.pools[emotion].start()
+
+    def emotion_path(self, emotion):
+        """Where the chain over the titles conveying the emotion is saved."""
+        return os.path.splitext(self.MARKOV_PATH)[0] + '.' + emotion + '.bin'
+
+    def add_title(self, title):
+        """Train the chain with an accepted title on the next dump."""
+        self._pending.append(normalise(title))
+
+    def dump(self):
+        """
+        Save the trained chains, the subject index and the template pool so that the next start can skip them.
 
-        logger.debug('generated template: ' + ''.join(tokens))
+        Titles added to the bank since the last dump are indexed by subject and
+        emotion, and trained into the chains of the prepared emotions they convey.
+        """
+        with self.lock:
+            for title in self._pending:
+                self.markov.add(title)
+            self._pending = []
+            self.markov.save(self.MARKOV_PATH)
 
-        return tokens
+            if self.subjects is not None and self.subjects.n_titles < len(self.title_bank):
+                items = list(self.title_bank.items())[self.subjects.n_titles:]
+                trained = set()
+                for (tid, info), emotions in zip(items, self.subjects.add(items, self.lexicon)):
+                    for emotion in emotions & self.chains.keys():
+                        self.chains[emotion].add(normalise(info['title']))
+                        trained.add(emotion)
+                self.subjects.save()
+                for emotion in trained:
+                    self.chains[emotion].save(self.emotion_path(emotion))
+        self.pool.dump()
 
-    def random_template(self):
-        """Get random template from the bank."""
-        for i in range(0, 25):
-            template = self._random_template()
-            if template is not None:
-                return template
-        raise RecursionError("Title generation was unable to find fitting template.")
+    def random_template(self, slots=None, emotion=None):
+        """Get random template from the bank, conditioned on the emotion if it was prepared."""
+        return self.pools.get(emotion, self.pool).pop(slots)
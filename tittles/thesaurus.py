@@ -1,30 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import json
+import os
+import sqlite3
+import threading
+import time
 import requests
 import xml.etree.ElementTree as ET
 from collections import Counter
 from nltk.corpus import wordnet as wn
 
+THESAURUS_URL = 'http://ngrams.ucd.ie/therex3/common-nouns/'
+CACHE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data", "thesaurus.sqlite")
+# Thesaurus Rex results change rarely, refetch them after 30 days.
+CACHE_TTL = 30 * 24 * 60 * 60
+# Seconds to wait for Thesaurus Rex to connect and answer before giving up on a query.
+REQUEST_TIMEOUT = 10
+
+# One session keeps the connection to Thesaurus Rex alive between queries.
+_session = requests.Session()
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='thesaurus')
+
+
+class DiskCache:
+    """Persistent key-value store for query results, entries expire after ttl seconds."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, fetched REAL)')
+        return self._db
+
+    def get(self, key):
+        with self._lock:
+            row = self._connect().execute('SELECT value, fetched FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        with self._lock:
+            db = self._connect()
+            db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', (key, json.dumps(value), time.time()))
+            db.commit()
+
+
+_disk_cache = DiskCache(CACHE_PATH, CACHE_TTL)
+
+
+@lru_cache(maxsize=4096)
+def _fetch(action, param, value, tag):
+    """
+    Fetch the weighted tag elements of a Thesaurus Rex query, normalized by the highest weight.
+
+    Results are cached in memory and on disk, the returned dictionary must not be modified.
+    """
+    key = f'{action}?{param}={value}#{tag}'
+    members = _disk_cache.get(key)
+    if members is None:
+        r = _session.get(THESAURUS_URL + action, params={param: value, 'xml': 'true'}, timeout=REQUEST_TIMEOUT)
+        root = ET.fromstring(r.text)
+        members = {m.text.strip(): int(m.attrib['weight']) for m in root.iter(tag)}
+        if members:
+            members = {k: v / max(members.values()) for k, v in members.items()}
+        _disk_cache.set(key, members)
+    return members
+
 def _query(category, modifier):
     """Query Thesaurus Rex and return results with normalized weights"""
-    r = requests.get('http://ngrams.ucd.ie/therex3/common-nouns/category.action',
-                     params={'cate': f'{modifier}:{category}', 'xml': 'true'})
-    root = ET.fromstring(r.text)
-    members = {m.text.strip(): int(m.attrib['weight']) for m in root.iter('Member')}
-    members = {k: v / max(members.values()) for k, v in members.items()}
-    return members
+    return dict(_fetch('category.action', 'cate', f'{modifier}:{category}', 'Member'))
 
 def find_nuances(category):
     """Find adjectives for category."""
-    r = requests.get('http://ngrams.ucd.ie/therex3/common-nouns/member.action',
-                     params={'kw': category, 'xml': 'true'})
-    root = ET.fromstring(r.text)
-    members = {m.text.strip(): int(m.attrib['weight']) for m in root.iter('Modifier')}
-    members = {k: v / max(members.values()) for k, v in members.items()}
-    return members
+    return dict(_fetch('member.action', 'kw', category, 'Modifier'))
+
+def _combine(results, n):
+    """Combine the member suggestions of n adjective queries."""
+    weights = Counter()
+    counts = Counter()
+    for members in results:
+        weights.update(members)
+        counts.update(members.keys())
+    members = weights.keys()
+    return {m: ((counts[m] - 1) / (n - 1) + weights[m] / n) / 2
+            for m in members}
 
 def find_members(category, adjectives):
     """
     Find suggested members from Thesaurus Rex based on category and adjectives.
 
+    The adjectives are queried concurrently.
+
     Args:
         Category (str) : category for the member
         Adjectives (list of str) : adjectives describing the member
@@ -33,16 +105,9 @@ def find_members(category, adjectives):
         Dictionary: key str : member name and value float [0, 1] : how relevant
         the suggestion is (high being better).
     """
-    weights = Counter()
-    counts = Counter()
-    for adjective in adjectives:
-        members = _query(category, adjective)
-        weights.update(members)
-        counts.update(members.keys())
-    members = weights.keys()
-    return {m: ((counts[m] - 1) / (len(adjectives) - 1) + weights[m] / len(adjectives)) / 2
-            for m in members}
+    return _combine(_executor.map(lambda adjective: _query(category, adjective), adjectives), len(adjectives))
 
+@lru_cache(maxsize=4096)
 def find_synonyms(word):
     """Find synonyms from WordNet"""
     words = set()
@@ -52,7 +117,52 @@ def find_synonyms(word):
             words |= set(a.lemma_names())
         for a in s.also_sees():
             words |= set(a.lemma_names())
-    return words
+    return frozenset(words)
+
+class LexicalContext:
+    """
+    In-memory view of the thesaurus for a single request.
+
+    Offers the same find_* functions as this module. Lookups resolved with
+    prefetch() are answered from memory, anything else falls back to the
+    module functions.
+    """
+
+    def __init__(self):
+        self.nuances = {}
+        self.synonyms = {}
+        self.queries = {}
+
+    def prefetch(self, nuances=(), synonyms=(), queries=()):
+        """
+        Resolve lookups concurrently and keep the results.
+
+        Args:
+            nuances (iterable of str) : Categories to find nuances for.
+            synonyms (iterable of str) : Words to find synonyms for.
+            queries (iterable of tuple) : (category, modifier) pairs to find members for.
+        """
+        nuances = [c for c in set(nuances) if c not in self.nuances]
+        synonyms = [w for w in set(synonyms) if w not in self.synonyms]
+        queries = [q for q in set(queries) if q not in self.queries]
+        self.nuances.update(zip(nuances, _executor.map(find_nuances, nuances)))
+        self.synonyms.update(zip(synonyms, _executor.map(find_synonyms, synonyms)))
+        self.queries.update(zip(queries, _executor.map(lambda q: _query(*q), queries)))
+
+    def find_nuances(self, category):
+        if category not in self.nuances:
+            self.nuances[category] = find_nuances(category)
+        return self.nuances[category]
+
+    def find_synonyms(self, word):
+        if word not in self.synonyms:
+            self.synonyms[word] = find_synonyms(word)
+        return self.synonyms[word]
+
+    def find_members(self, category, adjectives):
+        missing = [(category, a) for a in set(adjectives) if (category, a) not in self.queries]
+        self.queries.update(zip(missing, _executor.map(lambda q: _query(*q), missing)))
+        return _combine((self.queries[(category, a)] for a in adjectives), len(adjectives))
 
 if __name__ == "__main__":
     import sys
@@ -1,6 +1,6 @@
 import tarfile
 from os import path as op
-from read_gutenberg import readmetadata
+from read_gutenberg import streammetadata
 
 def check_local_data(directory=None):
     """
@@ -63,12 +63,13 @@ def gutenberg_preprocess():
         raise FileNotFoundError("The dataset does not exist in .data." +
                                 " Call download_gutenberg, or relocate file to .data")
 
-    metadata = readmetadata()
-
     cleaned = dict()
 
-    for k, v in metadata.items():
-        
+    # Only the titles and subjects of English books are kept, the rest of the catalog is streamed past.
+    # They are still collected into one dict, since the title bank is loaded as a single pickled dict.
+    for v in streammetadata():
+        k = v["id"]
+
         if v["language"] is None:
             continue
         elif "en" not in v["language"]:
@@ -0,0 +1,82 @@
+from array import array
+from bisect import bisect_left, insort
+import hashlib
+import math
+
+
+def normalise(title):
+    """Normalise a title before it is compared to or trained on other titles."""
+    return ' '.join(title.replace('—', '-').split())
+
+
+def _digest(title):
+    """128 bit digest of a title split into two unsigned 64 bit halves."""
+    digest = hashlib.blake2b(title.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+
+class BloomFilter:
+    """
+    Bloom filter over strings.
+
+    Membership tests can return false positives at roughly the configured
+    error rate while the filter holds at most capacity items, but never
+    false negatives.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing, the k positions are derived from two base hashes.
+        h1, h2 = _digest(item)
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class TitleSet:
+    """
+    Compact membership structure for normalised titles.
+
+    A Bloom filter answers most negative queries. Its positives are confirmed
+    against a sorted array of 64 bit title digests, so a title is kept in
+    about 10 bytes instead of as a Python string in a set. Two different titles
+    only collide if their digests do, which is negligible at title bank sizes.
+    """
+
+    def __init__(self, titles=(), capacity=None, error_rate=0.01):
+        titles = list(titles)
+        digests = sorted({_digest(title)[0] for title in titles})
+        if capacity is None:
+            # Leave room for the titles accepted while running.
+            capacity = 2 * len(digests) + 1000
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.digests = array('Q', digests)
+        for title in titles:
+            self.bloom.add(title)
+
+    def add(self, title):
+        if title in self:
+            return
+        self.bloom.add(title)
+        insort(self.digests, _digest(title)[0])
+
+    def __contains__(self, title):
+        if title not in self.bloom:
+            return False
+        digest = _digest(title)[0]
+        i = bisect_left(self.digests, digest)
+        return i < len(self.digests) and self.digests[i] == digest
+
+    def __len__(self):
+        return len(self.digests)
@@ -1,9 +1,10 @@
 import random
-from nltk.corpus import wordnet as wn
 try:
     from . import thesaurus
+    from .relations import RelationCache
 except ImportError:
     import thesaurus
+    from relations import RelationCache
 
 import logging
 logger = logging.getLogger(__name__)
@@ -14,30 +15,66 @@ class AttributeNotFound(Exception):
 
 
 class WordPicker():
+    NOUN_CATEGORIES = ['animal', 'object', 'item', 'artefact']
 
     def __init__(self):
         self.thesaurus = thesaurus
+        self.relations = RelationCache.load()
 
-    def find_pairs(self, adjectives, activity, location, weather, slots):
+    def dump(self):
+        """Saves the WordNet relations learned so far."""
+        self.relations.save()
+
+    def prefetch(self, adjectives, activity, location, weather):
+        """
+        Resolves the nuance and synonym lookups find_pairs can make for the given input, and the member queries of
+        the input adjectives and location nuances.
+
+        Member queries for synonyms of those are not prefetched, every synonym could be combined with every
+        category, while find_pairs only uses a few of them. They are resolved when needed, through the thesaurus
+        caches.
+
+        Returns:
+            thesaurus.LexicalContext : Context to pass to find_pairs.
+        """
+        context = self.thesaurus.LexicalContext()
+        subjects = [activity, location, weather]
+        context.prefetch(nuances=subjects, synonyms=adjectives[0] + adjectives[1])
+
+        nuances = {subject: set(context.find_nuances(subject)) for subject in subjects}
+        context.prefetch(synonyms=set().union(*nuances.values()))
+        animal = set(adjectives[0]).union(*(context.find_synonyms(a) for a in adjectives[0]))
+        human = set(adjectives[1]).union(*(context.find_synonyms(a) for a in adjectives[1]))
+        # Synonyms of the input adjectives, looked up by get_noun, and the
+        # member queries of the slots for the adjectives themselves
+        queries = [(category, a) for category in self.NOUN_CATEGORIES for a in adjectives[0]]
+        queries += [('person', a) for a in adjectives[1]]
+        queries += [('location', a) for a in nuances[location]]
+        context.prefetch(synonyms=animal | human, queries=queries)
+        return context
+
+    def find_pairs(self, adjectives, activity, location, weather, slots, context=None):
         """
         Finds 2 candidates for each slot of adjectives and nouns and picks the best combination (4 combinations with 2 slots)
         tags: 0 = adjective, 1 = noun, 2 = person, 3 = location
         Todo: add singular/plural checking
+
+        Lookups are answered from context when given, see prefetch.
         """
+        lexicon = self.thesaurus if context is None else context
 
         candidates = []
-        scores = []
         for i, slot in slots:
             if slot == 'ADJ':
-                candidates.append(self.get_adjective(random.choice([activity, location, weather])))
+                candidates.append(self.get_adjective(random.choice([activity, location, weather]), lexicon=lexicon))
             elif slot == 'NOUN' or slot == 'NOUNS':
-                candidates.append(self.get_noun(random.choice(['animal', 'object', 'item', 'artefact']),
-                                                adjectives[0], True))
+                candidates.append(self.get_noun(random.choice(self.NOUN_CATEGORIES),
+                                                adjectives[0], True, lexicon))
             elif slot == 'PERSON':
-                candidates.append(self.get_noun('person', adjectives[1], True))
+                candidates.append(self.get_noun('person', adjectives[1], True, lexicon))
             elif slot == 'LOC':
-                nuance_adj = self.get_adjective(location, 3)
-                candidates.append(self.get_noun('location', nuance_adj, False))
+                nuance_adj = self.get_adjective(location, 3, lexicon)
+                candidates.append(self.get_noun('location', nuance_adj, False, lexicon))
 
         logger.debug('candidates: ' + str(candidates))
 
@@ -51,10 +88,7 @@ class WordPicker():
             (candidates[0][1], candidates[1][0]),
             (candidates[0][1], candidates[1][1])
         ]
-        for i in range(len(candidate_pairs)):
-            candidate = candidate_pairs[i]
-            oppositeness = self.get_oppositeness_score(candidate[0], candidate[1])
-            scores.append(oppositeness)
+        scores = self.relations.score_pairs(candidate_pairs)
 
         logger.debug('candidate_pairs: ' + str(candidate_pairs))
         logger.debug('scores: ' + str(scores))
@@ -63,33 +97,35 @@ class WordPicker():
 
         return word_pair
 
-    def get_adjective(self, subject, n=2):
+    def get_adjective(self, subject, n=2, lexicon=None):
         """
         Returns candidates for adjective
         """
-        adjectives = set(self.thesaurus.find_nuances(subject))
+        lexicon = lexicon or self.thesaurus
+        adjectives = set(lexicon.find_nuances(subject))
         logger.debug('nuances of ' + subject + ': ' + str(adjectives))
         for adj in list(adjectives):
-            adjectives |= self.thesaurus.find_synonyms(adj)
+            adjectives |= lexicon.find_synonyms(adj)
         logger.debug('nuances of ' + subject + ' with synonyms: ' + str(adjectives))
         try:
             return random.sample(adjectives, n)
         except ValueError:
             raise AttributeNotFound("Input attributes cannot be found from Thesaurus Rex.")
 
-    def get_noun(self, category, adjectives, search_synonyms):
+    def get_noun(self, category, adjectives, search_synonyms, lexicon=None):
         """
         Returns two candidates for adjective
         """
+        lexicon = lexicon or self.thesaurus
         adjectives = set(adjectives)
         logger.debug('adjectives of ' + category + ': ' + str(adjectives))
         if search_synonyms:
             n = len(adjectives)
             for adj in list(adjectives):
-                adjectives |= self.thesaurus.find_synonyms(adj)
+                adjectives |= lexicon.find_synonyms(adj)
             adjectives = random.sample(adjectives, min(2 * n, len(adjectives)))
             logger.debug('adjectives of ' + category + ' with synonyms: ' + str(adjectives))
-        candidates = self.thesaurus.find_members(category, adjectives)
+        candidates = lexicon.find_members(category, adjectives)
         try:
             return random.sample(list(candidates), 2)
         except ValueError:
@@ -99,43 +135,6 @@ class WordPicker():
     def get_oppositeness_score(self, word1, word2):
         """
         Gets measure of how far words are from each other semantically, using WordNet
-        Score of 0.5 means words are related (hyper- or hyponyms) or semi-antonyms (hyper- or hyponym of antonym)
-        Score of 1 means words are antonyms or synonyms
-        If words are none of these things, wordnet path similarity is used
-        Default score: 0
+        See RelationCache.score for the scale.
         """
-        if word1 == word2:
-            return 0
-        opposites = []
-        related = []
-        antonym_related = []
-        synsets = wn.synsets(word1)
-        for synset in synsets:
-            if word2 in synset.lemma_names():
-                return -1
-            for hypernym in synset.hypernyms():
-                related.append(hypernym.lemmas()[0].name())
-            for hyponym in synset.hyponyms():
-                related.append(hyponym.lemmas()[0].name())
-            for lemma in synset.lemmas():
-                for antonym in lemma.antonyms():
-                    opposites.append(antonym.name())
-                    for hypernym in antonym.hypernyms():
-                        antonym_related.append(hypernym.name())
-                    for hyponym in antonym.hyponyms():
-                        antonym_related.append(hyponym.name())
-        if word2 in opposites:
-            return 1
-        if word2 in related:
-            return -0.5
-        if word2 in antonym_related:
-            return 0.5
-        synsets2 = wn.synsets(word2)
-        if len(synsets) == 0 or len(synsets2) == 0:
-            return 0
-        synset1 = synsets[0]
-        synset2 = synsets2[0]
-        wn_similarity = wn.path_similarity(synset1, synset2)
-        if wn_similarity == None:
-            return 0
-        return wn_similarity
+        return self.relations.score(word1, word2)